@@ -0,0 +1,272 @@
+"""
+Pixel agreement between two water masks written by `python -m apps.cog`:
+confusion matrix, IoU, Cohen's kappa and omission/commission areas.
+
+    python -m apps.agreement data/cog/jrc.tif data/cog/osm.tif
+    python -m apps.agreement --benchmark 20000
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rasterio
+import shapely
+import shapely.geometry
+from rasterio.enums import Resampling
+from rasterio.errors import WindowError
+from rasterio.features import geometry_mask
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window, from_bounds
+from .cache import TTLCache
+from .cog import COG_DIR, read_manifest
+
+EARTH_RADIUS = 6371.0088
+CHUNK = 2048
+
+agreement_cache = TTLCache(maxsize=64, ttl=None)
+
+
+def mask_path(name, cog_dir=COG_DIR):
+    """
+    Path of the local water mask of a layer, or None if none was ingested
+    """
+    record = read_manifest(cog_dir).get(name)
+    if record is None or not record.get("water_mask"):
+        return None
+    path = os.path.join(cog_dir, record["path"])
+    return path if os.path.exists(path) else None
+
+
+def confusion_counts(left, right, weights=None, valid=None):
+    """
+    2x2 matrix of (left, right) pixel pairs, rows left 0/1 and columns right 0/1.
+    Pixels that are not 0 or 1 in either mask are ignored.
+    """
+    ok = (left <= 1) & (right <= 1)
+    if valid is not None:
+        ok &= valid
+    index = left[ok].astype(np.intp) * 2 + right[ok]
+    if weights is not None:
+        weights = np.broadcast_to(weights, left.shape)[ok]
+    return np.bincount(index, weights=weights, minlength=4).reshape(2, 2)
+
+
+def metrics(pixels, areas=None):
+    """
+    Agreement statistics of a confusion matrix. The left mask is the reference,
+    so omission is water only in the left mask and commission water only in the
+    right mask.
+    """
+    (tn, fp), (fn, tp) = pixels
+    total = tn + fp + fn + tp
+    observed = (tp + tn) / total if total else 0.0
+    expected = (
+        ((tp + fn) * (tp + fp) + (tn + fp) * (tn + fn)) / total**2 if total else 0.0
+    )
+    result = {
+        "pixels": int(total),
+        "agreement": observed,
+        "iou": tp / (tp + fp + fn) if tp + fp + fn else 0.0,
+        "kappa": (observed - expected) / (1 - expected) if expected < 1 else 1.0,
+        "omission_rate": fn / (tp + fn) if tp + fn else 0.0,
+        "commission_rate": fp / (tp + fp) if tp + fp else 0.0,
+    }
+    if areas is not None:
+        result["omission_km2"] = float(areas[1][0])
+        result["commission_km2"] = float(areas[0][1])
+        result["both_km2"] = float(areas[1][1])
+    return result
+
+
+def row_areas(transform, crs, row_off, height):
+    """
+    Cell area in km² of each row of a window, a column vector
+    """
+    if crs is not None and crs.is_geographic:
+        top = transform.f + transform.e * row_off
+        edges = np.radians(top + transform.e * np.arange(height + 1))
+        band = np.abs(np.diff(np.sin(edges)))
+        area = EARTH_RADIUS**2 * math.radians(abs(transform.a)) * band
+    else:
+        area = np.full(height, abs(transform.a * transform.e) / 1e6)
+    return area[:, None]
+
+
+def _window_job(job):
+    left_path, right_path, window, geometries = job
+    with rasterio.open(left_path) as left_src, rasterio.open(right_path) as right_src:
+        left = left_src.read(1, window=window)
+        vrt_options = {
+            "crs": left_src.crs,
+            "transform": left_src.transform,
+            "width": left_src.width,
+            "height": left_src.height,
+            "resampling": Resampling.nearest,
+        }
+        with WarpedVRT(right_src, **vrt_options) as right_vrt:
+            right = right_vrt.read(1, window=window)
+
+        valid = None
+        if geometries:
+            valid = geometry_mask(
+                geometries,
+                out_shape=left.shape,
+                transform=left_src.window_transform(window),
+                invert=True,
+            )
+        weights = row_areas(
+            left_src.transform, left_src.crs, window.row_off, int(window.height)
+        )
+    return (
+        confusion_counts(left, right, valid=valid),
+        confusion_counts(left, right, weights=weights, valid=valid),
+    )
+
+
+def windows(width, height, chunk=CHUNK, bounds=None):
+    """
+    Split a raster, or the part of it in a pixel window `bounds`, into chunks
+    """
+    col0, row0, col1, row1 = bounds or (0, 0, width, height)
+    for row in range(row0, row1, chunk):
+        for col in range(col0, col1, chunk):
+            yield Window(col, row, min(chunk, col1 - col), min(chunk, row1 - row))
+
+
+def agreement(left_path, right_path, geometries=None, workers=None, chunk=CHUNK):
+    """
+    Compare two water masks on the grid of the left one, chunk by chunk across
+    processes so memory stays bounded. If GeoJSON-like geometries in the left
+    mask's CRS are given, only pixels inside them count.
+    Returns the metrics dict with the pixel and area confusion matrices. Raises
+    ValueError if the geometries do not overlap the left mask.
+    """
+    with rasterio.open(left_path) as src:
+        width, height = src.width, src.height
+        bounds = None
+        if geometries:
+            roi_bounds = shapely.total_bounds(
+                [shapely.geometry.shape(geometry) for geometry in geometries]
+            )
+            window = from_bounds(*roi_bounds, src.transform)
+            window = window.round_offsets().round_lengths()
+            try:
+                window = window.intersection(Window(0, 0, width, height))
+            except WindowError:
+                raise ValueError("The ROI does not overlap the water masks")
+            col, row = int(window.col_off), int(window.row_off)
+            bounds = (col, row, col + int(window.width), row + int(window.height))
+
+    jobs = [
+        (left_path, right_path, window, geometries)
+        for window in windows(width, height, chunk, bounds)
+    ]
+    pixels = np.zeros((2, 2))
+    areas = np.zeros((2, 2))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for window_pixels, window_areas in executor.map(_window_job, jobs):
+            pixels += window_pixels
+            areas += window_areas
+
+    result = metrics(pixels, areas)
+    result["confusion_pixels"] = pixels.astype(int).tolist()
+    result["confusion_km2"] = areas.tolist()
+    return result
+
+
+def roi_geometries(gdf, path):
+    """
+    GeoJSON-like geometries of an ROI GeoDataFrame in the CRS of a mask
+    """
+    with rasterio.open(path) as src:
+        crs = src.crs
+    if gdf.crs is None:
+        gdf = gdf.set_crs(epsg=4326)
+    return [shapely.geometry.mapping(geom) for geom in gdf.to_crs(crs).geometry]
+
+
+def cached_agreement(left_path, right_path, geometries=None, workers=None):
+    """
+    agreement() cached by the two masks and the ROI geometries
+    """
+    key = hashlib.sha1(
+        json.dumps(
+            [[path, os.path.getmtime(path)] for path in (left_path, right_path)]
+            + [geometries],
+            default=str,
+        ).encode("utf-8")
+    ).hexdigest()
+    result = agreement_cache.get(key)
+    if result is None:
+        result = agreement(left_path, right_path, geometries, workers)
+        agreement_cache.set(key, result)
+    return result
+
+
+def _write_synthetic(path, size, seed, chunk=CHUNK):
+    """
+    Write a size x size water mask of random blobs, one chunk at a time
+    """
+    profile = {
+        "driver": "GTiff",
+        "width": size,
+        "height": size,
+        "count": 1,
+        "dtype": "uint8",
+        "crs": "EPSG:4326",
+        "transform": rasterio.transform.from_bounds(-100, 30, -90, 40, size, size),
+        "tiled": True,
+        "blockxsize": 512,
+        "blockysize": 512,
+        "compress": "deflate",
+    }
+    rng = np.random.default_rng(seed)
+    with rasterio.open(path, "w", **profile) as dst:
+        for window in windows(size, size, chunk):
+            shape = (int(window.height), int(window.width))
+            noise = rng.random((shape[0] // 8 + 1, shape[1] // 8 + 1))
+            blobs = np.kron(noise, np.ones((8, 8)))[: shape[0], : shape[1]]
+            dst.write((blobs > 0.7).astype("uint8"), 1, window=window)
+
+
+def benchmark(size=20000, workers=None, chunk=CHUNK):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        left = os.path.join(tmp_dir, "left.tif")
+        right = os.path.join(tmp_dir, "right.tif")
+        _write_synthetic(left, size, 1, chunk)
+        _write_synthetic(right, size, 2, chunk)
+
+        start = time.perf_counter()
+        result = agreement(left, right, workers=workers, chunk=chunk)
+        seconds = time.perf_counter() - start
+    result["seconds"] = seconds
+    result["megapixels_per_second"] = size * size / seconds / 1e6
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("masks", nargs="*", help="left and right water mask paths")
+    parser.add_argument("--benchmark", type=int, metavar="SIZE")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--chunk", type=int, default=CHUNK)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        result = benchmark(args.benchmark, args.workers, args.chunk)
+    elif len(args.masks) == 2:
+        result = agreement(*args.masks, workers=args.workers, chunk=args.chunk)
+    else:
+        parser.error("pass two masks or --benchmark SIZE")
+    print(json.dumps(result, indent=4))
+
+
+if __name__ == "__main__":
+    main()
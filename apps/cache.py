@@ -0,0 +1,477 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import folium
+from . import tile_proxy
+from .tracing import span
+
+# Set GSWIS_CACHE_URL to share the tile URL, ROI and statistics caches between
+# processes: sqlite:///path/to/cache.db on one host, or redis://host:6379/0.
+CACHE_URL = os.environ.get("GSWIS_CACHE_URL")
+# Bump when the format of cached values changes, so shared caches written by an
+# older version of the app are ignored.
+CACHE_VERSION = 2
+
+
+class TTLCache:
+    """
+    A thread-safe LRU cache whose entries expire after ttl seconds.
+    If maxbytes is set, entries are also evicted once their total size exceeds it.
+    """
+
+    def __init__(self, maxsize=512, ttl=3600, maxbytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def get(self, key, default=None, count=True):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires, _ = item
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    if count:
+                        self.hits += 1
+                    return value
+                self._pop(key)
+            if count:
+                self.misses += 1
+            return default
+
+    def set(self, key, value, nbytes=0):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, expires, nbytes)
+            self.nbytes += nbytes
+            while len(self._data) > self.maxsize or (
+                self.maxbytes is not None
+                and self.nbytes > self.maxbytes
+                and len(self._data) > 1
+            ):
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key):
+        _, _, nbytes = self._data.pop(key)
+        self.nbytes -= nbytes
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.nbytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "nbytes": self.nbytes,
+        }
+
+
+# Earth Engine classes a shared cache value may hold.
+EE_CLASSES = ("Image", "ImageCollection", "Feature", "FeatureCollection", "Geometry")
+# Lifetime in s of shared entries cached without a ttl. Redis cannot enforce
+# maxsize or maxbytes per namespace, so every entry there must expire.
+SHARED_TTL = 24 * 3600
+
+
+def _encode(value):
+    """
+    JSON-compatible form of a cached value. Tuples, DataFrames, GeoDataFrames
+    and Earth Engine objects are tagged so loads() can rebuild them.
+    """
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, tuple):
+        return {"__type__": "tuple", "items": [_encode(item) for item in value]}
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _encode(item) for key, item in value.items()}
+    import geopandas as gpd
+    import pandas as pd
+
+    if isinstance(value, gpd.GeoDataFrame):
+        crs = None if value.crs is None else value.crs.to_string()
+        return {"__type__": "GeoDataFrame", "data": value.to_json(), "crs": crs}
+    if isinstance(value, pd.DataFrame):
+        return {"__type__": "DataFrame", "data": value.to_json(orient="split")}
+    if type(value).__module__.startswith("ee."):
+        import ee
+
+        if isinstance(value, ee.ComputedObject):
+            name = type(value).__name__
+            if name not in EE_CLASSES:
+                raise TypeError(f"cannot cache ee.{name}")
+            return {
+                "__type__": "ee",
+                "class": name,
+                "graph": ee.serializer.toJSON(value),
+            }
+    if hasattr(value, "item"):
+        # NumPy scalars, e.g. from a DataFrame reduction.
+        return value.item()
+    return value
+
+
+def _decode(obj):
+    kind = obj.get("__type__")
+    if kind is None:
+        return obj
+    if kind == "tuple":
+        return tuple(obj["items"])
+    if kind == "GeoDataFrame":
+        import geopandas as gpd
+
+        features = json.loads(obj["data"])["features"]
+        return gpd.GeoDataFrame.from_features(features, crs=obj["crs"])
+    if kind == "DataFrame":
+        import pandas as pd
+
+        return pd.read_json(
+            io.StringIO(obj["data"]), orient="split", convert_dates=False
+        )
+    if kind == "ee" and obj["class"] in EE_CLASSES:
+        import ee
+
+        return getattr(ee, obj["class"])(ee.deserializer.fromJSON(obj["graph"]))
+    raise ValueError(f"unknown cached type {kind}")
+
+
+def dumps(value):
+    """
+    Encode a cached value as JSON, Earth Engine objects as their ee.serializer
+    expression graph. Unlike pickle, loading it cannot run code, so a shared
+    backend writable by others is safe to read.
+    """
+    return json.dumps(_encode(value)).encode("utf-8")
+
+
+def loads(data):
+    return json.loads(data, object_hook=_decode)
+
+
+def _loads_or_none(data):
+    # Entries that fail to decode, e.g. written by an older version, are misses.
+    try:
+        return loads(data)
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def key_prefix(namespace):
+    """
+    Prefix of the versioned keys of a namespace in a shared backend
+    """
+    return f"gswis:v{CACHE_VERSION}:{namespace}:"
+
+
+def key_digest(key):
+    if not isinstance(key, str):
+        key = json.dumps(key, sort_keys=True, default=str)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def shared_key(namespace, key):
+    """
+    Versioned string key of a cache entry in a shared backend
+    """
+    return key_prefix(namespace) + key_digest(key)
+
+
+class SQLiteCache:
+    """
+    A TTLCache-compatible cache in a SQLite file, shared by the processes of one
+    host. Entries past maxsize or maxbytes are evicted least recently used first.
+    """
+
+    def __init__(self, path, namespace, maxsize=512, ttl=3600, maxbytes=None):
+        self.path = path
+        self.namespace = key_prefix(namespace)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT,
+                key TEXT,
+                value BLOB,
+                expires REAL,
+                used_at REAL,
+                PRIMARY KEY (namespace, key)
+            )""")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_used_at ON entries (namespace, used_at)"
+        )
+        self._conn.commit()
+
+    def __len__(self):
+        return self.stats()["size"]
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def get(self, key, default=None, count=True):
+        key = key_digest(key)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM entries WHERE namespace=? AND key=?",
+                (self.namespace, key),
+            ).fetchone()
+            value = None
+            if row is not None and (row[1] is None or row[1] > now):
+                value = _loads_or_none(row[0])
+            if value is not None:
+                self._conn.execute(
+                    "UPDATE entries SET used_at=? WHERE namespace=? AND key=?",
+                    (now, self.namespace, key),
+                )
+                self._conn.commit()
+                if count:
+                    self.hits += 1
+                return value
+            if count:
+                self.misses += 1
+        return default
+
+    def set(self, key, value, nbytes=0):
+        key = key_digest(key)
+        now = time.time()
+        expires = None if self.ttl is None else now + self.ttl
+        data = sqlite3.Binary(dumps(value))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, data, expires, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        self._conn.execute(
+            "DELETE FROM entries WHERE namespace=? AND expires < ?",
+            (self.namespace, time.time()),
+        )
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM entries "
+            "WHERE namespace=?",
+            (self.namespace,),
+        ).fetchone()
+        while count > self.maxsize or (
+            self.maxbytes is not None and total > self.maxbytes and count > 1
+        ):
+            key, size = self._conn.execute(
+                "SELECT key, LENGTH(value) FROM entries WHERE namespace=? "
+                "ORDER BY used_at LIMIT 1",
+                (self.namespace,),
+            ).fetchone()
+            self._conn.execute(
+                "DELETE FROM entries WHERE namespace=? AND key=?",
+                (self.namespace, key),
+            )
+            count -= 1
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM entries WHERE namespace=?", (self.namespace,)
+            )
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            size, nbytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM entries "
+                "WHERE namespace=?",
+                (self.namespace,),
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": size,
+            "nbytes": nbytes,
+        }
+
+
+class RedisCache:
+    """
+    A TTLCache-compatible cache in Redis, shared by processes on any host.
+    Entries expire after ttl seconds, or SHARED_TTL if ttl is None, since
+    maxsize and maxbytes are not enforced; Redis' maxmemory policy bounds the
+    total size. Pass `client` to use an existing client, e.g. fakeredis in tests.
+    """
+
+    def __init__(self, url, namespace, ttl=3600, client=None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.namespace = namespace
+        self.ttl = SHARED_TTL if ttl is None else ttl
+        self.hits = 0
+        self.misses = 0
+        self._prefix = key_prefix(namespace)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self._prefix + "*"))
+
+    def __contains__(self, key):
+        return self.client.exists(shared_key(self.namespace, key)) > 0
+
+    def get(self, key, default=None, count=True):
+        data = self.client.get(shared_key(self.namespace, key))
+        value = None if data is None else _loads_or_none(data)
+        if value is None:
+            if count:
+                self.misses += 1
+            return default
+        if count:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, nbytes=0):
+        ttl = max(int(self.ttl), 1)
+        self.client.set(shared_key(self.namespace, key), dumps(value), ex=ttl)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self._prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+
+def make_cache(namespace, maxsize=512, ttl=3600, maxbytes=None, url=None):
+    """
+    A cache shared through the backend of GSWIS_CACHE_URL (or `url`), or a
+    process-local TTLCache if none is set
+    """
+    url = url or CACHE_URL
+    if not url or url == "memory://":
+        return TTLCache(maxsize, ttl, maxbytes)
+    if url.startswith("sqlite:///"):
+        return SQLiteCache(url[len("sqlite:///") :], namespace, maxsize, ttl, maxbytes)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(url, namespace, ttl)
+    raise ValueError(f"unsupported cache URL {url}")
+
+
+def fingerprint(ee_object):
+    """
+    Hash the serialized expression graph of an Earth Engine object without a server call
+    """
+    if ee_object is None:
+        return None
+    return hashlib.sha1(ee_object.serialize().encode("utf-8")).hexdigest()
+
+
+def tile_key(asset, style=None, vis_params=None, roi=None):
+    """
+    Build a canonical cache key from an asset id, style dict, vis params and ROI
+    """
+    return json.dumps(
+        [asset, style or {}, vis_params or {}, fingerprint(roi)],
+        sort_keys=True,
+        default=str,
+    )
+
+
+def object_key(ee_object, vis_params=None):
+    """
+    Cache key of an Earth Engine object from its serialized graph and vis params
+    """
+    return json.dumps(
+        [fingerprint(ee_object), vis_params or {}], sort_keys=True, default=str
+    )
+
+
+# Shared by every session in the process (and by every process with
+# GSWIS_CACHE_URL), so reruns and concurrent users reuse the same map IDs.
+tile_url_cache = make_cache("tile_url", maxsize=512, ttl=3600)
+
+
+def get_tile_url(ee_object, vis_params=None, key=None):
+    """
+    Return the XYZ tile URL template of an ee.Image, calling getMapId only on a cache miss
+    """
+    vis_params = vis_params or {}
+    if key is None:
+        key = object_key(ee_object, vis_params)
+
+    url = tile_url_cache.get(key)
+    if url is None:
+        with span("getMapId"):
+            map_id = ee_object.getMapId(vis_params)
+        url = map_id["tile_fetcher"].url_format
+        tile_url_cache.set(key, url)
+    return url
+
+
+def cached_tile_layer(
+    ee_object, vis_params=None, name="Layer untitled", shown=True, opacity=1.0, key=None
+):
+    """
+    Drop-in replacement for geemap.ee_tile_layer backed by the shared tile URL cache.
+    When the tile proxy is enabled, the browser fetches tiles through it.
+    """
+    if key is None:
+        key = object_key(ee_object, vis_params)
+    url = get_tile_url(ee_object, vis_params, key)
+    if tile_proxy.enabled():
+        url = tile_proxy.proxied_url(key, url)
+    return folium.raster_layers.TileLayer(
+        tiles=url,
+        attr="Google Earth Engine",
+        name=name,
+        overlay=True,
+        control=True,
+        show=shown,
+        opacity=opacity,
+        max_zoom=24,
+    )
+
+
+def add_cached_layer(
+    m, ee_object, vis_params=None, name="Layer untitled", shown=True, key=None
+):
+    """
+    Drop-in replacement for Map.addLayer backed by the shared tile URL cache
+    """
+    layer = cached_tile_layer(ee_object, vis_params, name, shown, key=key)
+    layer.add_to(m)
+    return layer
@@ -0,0 +1,166 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
+
+import ee
+from . import vector_tiles
+from .cache import cached_tile_layer, tile_key
+from .tracing import propagate, span
+from .upload import read_vector
+
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), "catalog.json")
+# Local copies of catalog layers, served without Earth Engine when present.
+DATA_DIR = os.environ.get("GSWIS_DATA_DIR", "data")
+# Default ROI of the map pages.
+COUNTRIES = "users/giswqs/public/countries"
+
+# Bounded pool shared by all sessions for the blocking getMapId requests.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gswis-layers")
+
+
+@lru_cache(maxsize=None)
+def load_catalog(path=CATALOG_PATH):
+    """
+    Load the layer catalog, a dict of groups mapping layer names to entries
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def layer_names(group="surface_water"):
+    return list(load_catalog()[group].keys())
+
+
+def get_entry(name, group="surface_water"):
+    """
+    Look up a catalog entry by layer name
+    """
+    return load_catalog()[group][name]
+
+
+def legend_dict(names, group="surface_water"):
+    """
+    Build a geemap legend_dict for the given layer names
+    """
+    return {name: get_entry(name, group)["legend"] for name in names}
+
+
+def build_ee_object(spec, roi=None):
+    """
+    Build the ee.Image drawn for one layer spec, applying its ROI behaviour
+    """
+    if spec["type"] == "FeatureCollection":
+        fc = ee.FeatureCollection(spec["asset"])
+        if spec.get("roi") == "filterBounds" and roi is not None:
+            fc = fc.filterBounds(roi)
+        image = fc.style(**spec.get("style", {}))
+    elif spec["type"] == "ImageCollection":
+        image = getattr(ee.ImageCollection(spec["asset"]), spec["reducer"])()
+    else:
+        image = ee.Image(spec["asset"])
+
+    if spec.get("roi") == "clip" and roi is not None:
+        image = image.clipToCollection(roi)
+    return image
+
+
+def local_path(spec):
+    """
+    Path of the local copy of a layer spec, or None if there is none
+    """
+    if "local" not in spec:
+        return None
+    path = os.path.join(DATA_DIR, spec["local"])
+    return path if os.path.exists(path) else None
+
+
+@lru_cache(maxsize=16)
+def read_local(path):
+    return read_vector(path)
+
+
+def layer_key(spec, roi=None):
+    """
+    Cache key of a layer spec; the ROI only counts for layers that depend on it
+    """
+    if spec.get("roi") is None:
+        roi = None
+    return tile_key(spec["asset"], spec.get("style"), spec.get("vis"), roi)
+
+
+def get_tile_layers(name, roi=None, group="surface_water"):
+    """
+    Create the folium tile layers for a catalog entry, in catalog order
+    """
+    layers = []
+    with span("layer_construction"):
+        for spec in get_entry(name, group)["layers"]:
+            path = local_path(spec)
+            if path is not None and vector_tiles.available():
+                style = spec.get("style", {})
+                color = "#" + style.get("fillColor", "3388ff")[:6]
+                tile_name = os.path.splitext(spec["local"])[0]
+                gdf = read_local(path)
+                hover = False
+                if group == "watersheds":
+                    from .zonal import join_stats
+
+                    joined, version = join_stats(gdf)
+                    if joined is not None:
+                        gdf, tile_name, hover = joined, f"{tile_name}_{version}", True
+                layers.append(
+                    vector_tiles.folium_layer(
+                        tile_name,
+                        gdf,
+                        color,
+                        spec.get("name", name),
+                        hover=hover,
+                        source=path,
+                    )
+                )
+                continue
+            layers.append(
+                cached_tile_layer(
+                    build_ee_object(spec, roi),
+                    spec.get("vis", {}),
+                    spec.get("name", name),
+                    shown=spec.get("shown", True),
+                    key=layer_key(spec, roi),
+                )
+            )
+    return layers
+
+
+def submit_tile_layers(names, roi=None, group="surface_water"):
+    """
+    Start resolving the tile layers of several catalog entries concurrently
+    """
+    return [
+        (name, _executor.submit(propagate(get_tile_layers), name, roi, group))
+        for name in names
+    ]
+
+
+def add_resolved_layers(m, pending):
+    """
+    Wait for every submitted entry, then add the layers to a map in submission order.
+    Returns a dict mapping the names that failed to their exception.
+    """
+    wait([future for _, future in pending])
+
+    errors = {}
+    for name, future in pending:
+        if future.exception() is not None:
+            errors[name] = future.exception()
+            continue
+        for layer in future.result():
+            layer.add_to(m)
+    return errors
+
+
+def add_catalog_layers(m, names, roi=None, group="surface_water"):
+    """
+    Add the tile layers of several catalog entries to a map
+    """
+    return add_resolved_layers(m, submit_tile_layers(names, roi, group))
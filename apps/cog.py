@@ -0,0 +1,283 @@
+"""
+Convert GeoTIFF/NetCDF exports into tiled, compressed Cloud-Optimized GeoTIFFs
+with overviews, and record them in a manifest the layer registry reads.
+
+    python -m apps.cog "NASA DEM=exports/nasadem.tif" --out-dir data/cog
+    python -m apps.cog "NLCD 2019=nlcd.tif" --water-values 11,95 --out-dir data/cog
+    python -m apps.cog "JRC=NETCDF:jrc.nc:occurrence" --water-min 50 --workers 4
+    python -m apps.cog --benchmark 8192
+"""
+
+import argparse
+import json
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.shutil import copy as copy_raster
+from rasterio.transform import from_origin
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window
+
+# Cloud-Optimized GeoTIFFs and water masks read by the local raster backend and
+# the agreement and zonal statistics.
+COG_DIR = os.environ.get("GSWIS_COG_DIR", os.path.join("data", "cog"))
+DEFAULT_CRS = "EPSG:4326"
+MANIFEST = "manifest.json"
+MASK_NODATA = 255
+
+
+def slugify(name):
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+
+def _write_water_mask(src, path, water_values=None, water_min=None):
+    """
+    Write a byte mask (1 water, 0 land, 255 nodata) of a raster, block by block
+    """
+    profile = {
+        "driver": "GTiff",
+        "width": src.width,
+        "height": src.height,
+        "count": 1,
+        "dtype": "uint8",
+        "crs": src.crs,
+        "transform": src.transform,
+        "nodata": MASK_NODATA,
+        "tiled": True,
+        "blockxsize": 512,
+        "blockysize": 512,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        for _, window in dst.block_windows(1):
+            data = src.read(1, window=window, masked=True)
+            if water_values is not None:
+                water = np.isin(data.filled(0), water_values)
+            else:
+                water = data.filled(0) >= water_min
+            mask = water.astype("uint8")
+            mask[np.ma.getmaskarray(data)] = MASK_NODATA
+            dst.write(mask, 1, window=window)
+
+
+def convert(
+    src_path,
+    dst_path,
+    crs=DEFAULT_CRS,
+    nodata=None,
+    water_values=None,
+    water_min=None,
+    blocksize=512,
+):
+    """
+    Reproject a raster to `crs` and write it as a COG with overviews. If
+    water_values or water_min is given, a water mask is written instead.
+    Returns the manifest record of the output.
+    """
+    resampling = "nearest"
+    with rasterio.open(src_path) as src:
+        src_nodata = src.nodata if nodata is None else nodata
+        vrt_options = {"crs": crs, "resampling": Resampling[resampling]}
+        if src.crs is None:
+            vrt_options["src_crs"] = DEFAULT_CRS
+        if src_nodata is not None:
+            vrt_options["src_nodata"] = src_nodata
+            vrt_options["nodata"] = src_nodata
+
+        with WarpedVRT(src, **vrt_options) as vrt:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                source = vrt
+                if water_values is not None or water_min is not None:
+                    mask_path = os.path.join(tmp_dir, "mask.tif")
+                    _write_water_mask(vrt, mask_path, water_values, water_min)
+                    source = mask_path
+                copy_raster(
+                    source,
+                    dst_path,
+                    driver="COG",
+                    BLOCKSIZE=blocksize,
+                    COMPRESS="DEFLATE",
+                    OVERVIEWS="AUTO",
+                    RESAMPLING=resampling.upper(),
+                    BIGTIFF="IF_SAFER",
+                )
+
+    with rasterio.open(dst_path) as dst:
+        return {
+            "path": os.path.basename(dst_path),
+            "crs": dst.crs.to_string(),
+            "bounds": list(dst.bounds),
+            "nodata": dst.nodata,
+            "dtype": dst.dtypes[0],
+            "width": dst.width,
+            "height": dst.height,
+            "overviews": dst.overviews(1),
+            "water_mask": water_values is not None or water_min is not None,
+        }
+
+
+def _convert_job(job):
+    name, src_path, dst_path, kwargs = job
+    return name, convert(src_path, dst_path, **kwargs)
+
+
+def read_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def ingest(inputs, out_dir, workers=None, **kwargs):
+    """
+    Convert NAME=PATH inputs in parallel and merge them into the manifest
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = []
+    for item in inputs:
+        name, _, src_path = item.rpartition("=")
+        if not name:
+            name = os.path.splitext(os.path.basename(src_path.split(":")[-1]))[0]
+        dst_path = os.path.join(out_dir, f"{slugify(name)}.tif")
+        jobs.append((name, src_path, dst_path, kwargs))
+
+    manifest = read_manifest(out_dir)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for name, record in executor.map(_convert_job, jobs):
+            print(f"{name}: {record['path']} overviews={record['overviews']}")
+            manifest[name] = record
+
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=4)
+    return manifest
+
+
+def _write_plain(path, size, seed=0):
+    """
+    Write a size x size striped, DEFLATE-compressed GeoTIFF without overviews,
+    like a raw export
+    """
+    profile = {
+        "driver": "GTiff",
+        "width": size,
+        "height": size,
+        "count": 1,
+        "dtype": "uint8",
+        "crs": DEFAULT_CRS,
+        "transform": from_origin(-100, 40, 1 / 3600, 1 / 3600),
+        "nodata": MASK_NODATA,
+        "compress": "deflate",
+    }
+    rng = np.random.default_rng(seed)
+    rows = 256
+    with rasterio.open(path, "w", **profile) as dst:
+        for row in range(0, size, rows):
+            height = min(rows, size - row)
+            noise = rng.random((height // 8 + 1, size // 8 + 1))
+            blobs = np.kron(noise, np.ones((8, 8)))[:height, :size]
+            dst.write(
+                (blobs > 0.7).astype("uint8"), 1, window=Window(0, row, size, height)
+            )
+
+
+def tile_latency(path, levels=3, tiles=50, tile_size=256, seed=0):
+    """
+    Time reads of random tile_size px tiles from a raster, per zoom level below
+    full resolution (0), the way a tile server reads them: the file is opened
+    for each tile with a small block cache. Returns {level: {"p50_ms", "p95_ms"}}.
+    """
+    rng = np.random.default_rng(seed)
+    result = {}
+    with rasterio.open(path) as src:
+        width, height = src.width, src.height
+    with rasterio.Env(GDAL_CACHEMAX=16):
+        for level in range(levels):
+            span = min(tile_size * 2**level, width, height)
+            times = []
+            for _ in range(tiles):
+                # Tiles are aligned to the grid of their zoom level.
+                col = int(rng.integers(0, width // span)) * span
+                row = int(rng.integers(0, height // span)) * span
+                start = time.perf_counter()
+                with rasterio.open(path) as src:
+                    src.read(
+                        1,
+                        window=Window(col, row, span, span),
+                        out_shape=(tile_size, tile_size),
+                        resampling=Resampling.nearest,
+                    )
+                times.append((time.perf_counter() - start) * 1e3)
+            result[level] = {
+                "p50_ms": float(np.percentile(times, 50)),
+                "p95_ms": float(np.percentile(times, 95)),
+            }
+    return result
+
+
+def benchmark(size=8192, levels=5, tiles=50):
+    """
+    Tile read latency of a synthetic plain GeoTIFF before and after conversion
+    to a COG
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        plain = os.path.join(tmp_dir, "plain.tif")
+        cog = os.path.join(tmp_dir, "cog.tif")
+        _write_plain(plain, size)
+        start = time.perf_counter()
+        record = convert(plain, cog)
+        seconds = time.perf_counter() - start
+        result = {
+            "size": size,
+            "convert_seconds": seconds,
+            "overviews": record["overviews"],
+            "megabytes": {
+                "plain": os.path.getsize(plain) / 2**20,
+                "cog": os.path.getsize(cog) / 2**20,
+            },
+            "plain": tile_latency(plain, levels, tiles),
+            "cog": tile_latency(cog, levels, tiles),
+        }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("inputs", nargs="*", help="rasters as NAME=PATH or PATH")
+    parser.add_argument("--out-dir", default=COG_DIR)
+    parser.add_argument("--crs", default=DEFAULT_CRS)
+    parser.add_argument("--nodata", type=float)
+    parser.add_argument("--water-values", help="comma-separated water class values")
+    parser.add_argument("--water-min", type=float, help="minimum value that is water")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--benchmark", type=int, metavar="SIZE")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.benchmark), indent=4))
+        return
+    if not args.inputs:
+        parser.error("pass rasters to convert or --benchmark SIZE")
+
+    water_values = None
+    if args.water_values:
+        water_values = [float(v) for v in args.water_values.split(",")]
+
+    ingest(
+        args.inputs,
+        args.out_dir,
+        workers=args.workers,
+        crs=args.crs,
+        nodata=args.nodata,
+        water_values=water_values,
+        water_min=args.water_min,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Local index of the country boundaries behind the "Select a country" ROI picker:
+names, ISO codes, bounding boxes and simplified geometries per zoom band, so
+listing, picking and centering on a country needs no Earth Engine request.
+
+    python -m apps.countries
+    python -m apps.countries --source ne_10m_admin_0_countries.shp
+"""
+
+import argparse
+import os
+from functools import lru_cache
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from .catalog import COUNTRIES, DATA_DIR
+from .lod import ZOOM_BANDS, bbox_zoom, pixel_size
+
+COUNTRY_INDEX = os.path.join(DATA_DIR, "countries.parquet")
+NAME_COLUMN = "name"
+ISO_COLUMNS = ["iso_a3", "ISO_A3", "adm0_a3", "ADM0_A3", "iso3", "ISO3"]
+
+
+def view_bounds(geom):
+    """
+    Bounds of the largest part of a geometry, so countries with far-flung
+    islands or parts across the antimeridian open on their mainland
+    """
+    parts = shapely.get_parts(geom)
+    return shapely.bounds(parts[np.argmax(shapely.area(parts))])
+
+
+def build(gdf, zooms=ZOOM_BANDS):
+    """
+    Index table of a country layer: one row per country with its name, ISO code,
+    bounds, view bounds and a WKB geometry simplified for each zoom band
+    """
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    gdf = gdf[gdf[NAME_COLUMN].notna()].dissolve(by=NAME_COLUMN, as_index=False)
+    iso = next((column for column in ISO_COLUMNS if column in gdf.columns), None)
+    geoms = gdf.geometry.to_numpy()
+
+    index = gpd.GeoDataFrame(
+        {
+            "name": gdf[NAME_COLUMN].astype(str),
+            "iso": gdf[iso].astype(str) if iso else "",
+        },
+        geometry=shapely.simplify(geoms, pixel_size(zooms[-1]), preserve_topology=True),
+        crs="EPSG:4326",
+    )
+    index[["minx", "miny", "maxx", "maxy"]] = shapely.bounds(geoms)
+    index[["view_minx", "view_miny", "view_maxx", "view_maxy"]] = [
+        view_bounds(geom) for geom in geoms
+    ]
+    for zoom in zooms[:-1]:
+        index[f"geometry_{zoom}"] = shapely.to_wkb(
+            shapely.simplify(geoms, pixel_size(zoom), preserve_topology=True)
+        )
+    return index.sort_values("name", ignore_index=True)
+
+
+class CountryIndex:
+    """
+    The country index of one process. Names are looked up in a dict, and each
+    country's geometries are decoded once per zoom band.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.names = table["name"].tolist()
+        self._rows = {name: i for i, name in enumerate(self.names)}
+        self._iso = table["iso"].tolist()
+        self._bounds = table[["minx", "miny", "maxx", "maxy"]].to_numpy()
+        self._view_bounds = table[
+            ["view_minx", "view_miny", "view_maxx", "view_maxy"]
+        ].to_numpy()
+        self._zooms = sorted(
+            int(column.split("_")[1])
+            for column in table.columns
+            if column.startswith("geometry_")
+        )
+        self._geometries = {}
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def __len__(self):
+        return len(self.names)
+
+    def lookup(self, name):
+        """
+        Record of a country: name, iso, bbox and view_bbox
+        """
+        row = self._rows[name]
+        return {
+            "name": name,
+            "iso": self._iso[row],
+            "bbox": tuple(self._bounds[row].tolist()),
+            "view_bbox": tuple(self._view_bounds[row].tolist()),
+        }
+
+    def view(self, name, width=1024, height=768):
+        """
+        Map center latitude, longitude and zoom level that fit a country
+        """
+        minx, miny, maxx, maxy = self.lookup(name)["view_bbox"]
+        zoom = bbox_zoom((minx, miny, maxx, maxy), width, height)
+        return (miny + maxy) / 2, (minx + maxx) / 2, zoom
+
+    def geometry(self, name, zoom=None):
+        """
+        A one-row GeoDataFrame of a country, simplified for the most detailed
+        zoom band at or below `zoom`
+        """
+        bands = [band for band in self._zooms if zoom is not None and band <= zoom]
+        band = bands[-1] if bands else None
+        key = (name, band)
+        if key not in self._geometries:
+            row = self._rows[name]
+            if band is None:
+                geom = self.table.geometry.iloc[row]
+            else:
+                geom = shapely.from_wkb(self.table[f"geometry_{band}"].iloc[row])
+            self._geometries[key] = gpd.GeoDataFrame(
+                {"name": [name]}, geometry=[geom], crs="EPSG:4326"
+            )
+        return self._geometries[key]
+
+
+@lru_cache(maxsize=2)
+def _load(path, mtime):
+    return CountryIndex(gpd.read_parquet(path))
+
+
+def load_countries(path=COUNTRY_INDEX):
+    """
+    The CountryIndex of a GeoParquet file written by `python -m apps.countries`,
+    loaded once per process, or None if there is none
+    """
+    if not os.path.exists(path):
+        return None
+    return _load(path, os.path.getmtime(path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--source",
+        help="local country layer with a name column, default the Earth Engine "
+        f"asset {COUNTRIES}",
+    )
+    parser.add_argument("--out", default=COUNTRY_INDEX)
+    args = parser.parse_args(argv)
+
+    if args.source:
+        from .upload import read_vector
+
+        gdf = read_vector(args.source)
+    else:
+        import ee
+        import geemap
+        from .data_dict import initialize
+
+        initialize()
+        gdf = geemap.ee_to_gdf(ee.FeatureCollection(COUNTRIES))
+
+    index = build(gdf)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    index.to_parquet(args.out, index=False)
+    print(f"{len(index)} countries written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
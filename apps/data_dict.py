@@ -1,8 +1,34 @@
+import os
+import threading
+import time
+from functools import lru_cache
+from types import MappingProxyType
+
 import ee
 import geemap.colormaps as cm
 import geemap.foliumap as geemap
+from .cache import TTLCache, fingerprint
+from .cog import COG_DIR, read_manifest
+from .tracing import span
+
+
+def _freeze(value):
+    """
+    Read-only copy of nested dicts and lists, so shared specs cannot be mutated
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
 
-geemap.ee_initialize()
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
 
 
 dem_vis = {"min": 0, "max": 4000, "palette": cm.get_palette("terrain", 15)}
@@ -33,73 +59,258 @@ esri_vis = {
     "palette": list(geemap.builtin_legends["ESRI_LandCover"].values()),
 }
 
-DEMS = {
-    "STRM": {"id": ee.Image("CGIAR/SRTM90_V4"), "vis": dem_vis},
-    "NASA SRTM": {
-        "id": ee.Image("USGS/SRTMGL1_003").select("elevation"),
-        "vis": dem_vis,
-    },
-    "NASA DEM": {
-        "id": ee.Image("NASA/NASADEM_HGT/001").select("elevation"),
-        "vis": dem_vis,
-    },
-    "ASTER GDEM": {
-        "id": ee.Image("projects/sat-io/open-datasets/ASTER/GDEM"),
-        "vis": dem_vis,
-    },
-    "ALOS DEM": {
-        "id": ee.ImageCollection("JAXA/ALOS/AW3D30/V3_2")
-        .mosaic()
-        .select("DSM")
-        .rename("elevation"),
-        "vis": dem_vis,
-    },
-    "GLO-30": {
-        "id": ee.ImageCollection("projects/sat-io/open-datasets/GLO-30")
-        .mosaic()
-        .rename("elevation"),
-        "vis": dem_vis,
-    },
-    "FABDEM": {
-        "id": ee.ImageCollection("projects/sat-io/open-datasets/FABDEM")
-        .mosaic()
-        .rename("elevation"),
-        "vis": dem_vis,
-    },
-    "NED": {
-        "id": ee.Image("USGS/3DEP/10m"),
-        "vis": dem_vis,
-    },
-}
+EARTH_ENGINE = "Earth Engine"
+LOCAL_COG = "Local COG"
 
-LANDCOVERS = {
-    "ESA WorldCover": {
-        "id": ee.ImageCollection("ESA/WorldCover/v100").first(),
-        "vis": {},
-    },
-    "ESRI Global Land Cover": {
-        "id": ee.ImageCollection(
-            "projects/sat-io/open-datasets/landcover/ESRI_Global-LULC_10m"
-        ).mosaic(),
-        "vis": esri_vis,
-    },
-    "NLCD 2019": {
-        "id": ee.Image("USGS/NLCD_RELEASES/2019_REL/NLCD/2019").select("landcover"),
-        "vis": {},
-    },
-}
+# Registry entries only describe a layer. The ee.Image is built by get_image()
+# the first time a layer is selected, so importing this module makes no
+# Earth Engine calls. The registries are frozen; pages derive per-request
+# variants with vis_params() and derived_image().
+DEMS = _freeze(
+    {
+        "STRM": {"asset": "CGIAR/SRTM90_V4", "cog": "strm.tif", "vis": dem_vis},
+        "NASA SRTM": {
+            "asset": "USGS/SRTMGL1_003",
+            "cog": "nasa_srtm.tif",
+            "select": "elevation",
+            "vis": dem_vis,
+        },
+        "NASA DEM": {
+            "asset": "NASA/NASADEM_HGT/001",
+            "cog": "nasa_dem.tif",
+            "select": "elevation",
+            "vis": dem_vis,
+        },
+        "ASTER GDEM": {
+            "asset": "projects/sat-io/open-datasets/ASTER/GDEM",
+            "cog": "aster_gdem.tif",
+            "vis": dem_vis,
+        },
+        "ALOS DEM": {
+            "asset": "JAXA/ALOS/AW3D30/V3_2",
+            "cog": "alos_dem.tif",
+            "collection": "mosaic",
+            "select": "DSM",
+            "rename": "elevation",
+            "vis": dem_vis,
+        },
+        "GLO-30": {
+            "asset": "projects/sat-io/open-datasets/GLO-30",
+            "cog": "glo_30.tif",
+            "collection": "mosaic",
+            "rename": "elevation",
+            "vis": dem_vis,
+        },
+        "FABDEM": {
+            "asset": "projects/sat-io/open-datasets/FABDEM",
+            "cog": "fabdem.tif",
+            "collection": "mosaic",
+            "rename": "elevation",
+            "vis": dem_vis,
+        },
+        "NED": {
+            "asset": "USGS/3DEP/10m",
+            "cog": "ned.tif",
+            "vis": dem_vis,
+        },
+    }
+)
 
-LANDFORMS = {
-    "Global ALOS Landforms": {
-        "id": ee.Image("CSP/ERGo/1_0/Global/ALOS_landforms").select("constant"),
-        "vis": landform_vis,
-    },
-    "Global SRTM Landforms": {
-        "id": ee.Image("CSP/ERGo/1_0/Global/SRTM_landforms").select("constant"),
-        "vis": landform_vis,
-    },
-    "NED Landforms": {
-        "id": ee.Image("CSP/ERGo/1_0/US/landforms").select("constant"),
-        "vis": landform_vis,
-    },
-}
+LANDCOVERS = _freeze(
+    {
+        "ESA WorldCover": {
+            "asset": "ESA/WorldCover/v100",
+            "cog": "esa_worldcover.tif",
+            "collection": "first",
+            "vis": {},
+        },
+        "ESRI Global Land Cover": {
+            "asset": "projects/sat-io/open-datasets/landcover/ESRI_Global-LULC_10m",
+            "cog": "esri_global_land_cover.tif",
+            "collection": "mosaic",
+            "vis": esri_vis,
+        },
+        "NLCD 2019": {
+            "asset": "USGS/NLCD_RELEASES/2019_REL/NLCD/2019",
+            "cog": "nlcd_2019.tif",
+            "select": "landcover",
+            "vis": {},
+        },
+    }
+)
+
+LANDFORMS = _freeze(
+    {
+        "Global ALOS Landforms": {
+            "asset": "CSP/ERGo/1_0/Global/ALOS_landforms",
+            "cog": "global_alos_landforms.tif",
+            "select": "constant",
+            "vis": landform_vis,
+        },
+        "Global SRTM Landforms": {
+            "asset": "CSP/ERGo/1_0/Global/SRTM_landforms",
+            "cog": "global_srtm_landforms.tif",
+            "select": "constant",
+            "vis": landform_vis,
+        },
+        "NED Landforms": {
+            "asset": "CSP/ERGo/1_0/US/landforms",
+            "cog": "ned_landforms.tif",
+            "select": "constant",
+            "vis": landform_vis,
+        },
+    }
+)
+
+# Clipped variants of registry images, keyed by (layer, ROI fingerprint).
+derived_cache = TTLCache(maxsize=128, ttl=None)
+
+# Seconds before a failed Earth Engine initialization is retried, doubled after
+# each consecutive failure up to RETRY_MAX.
+RETRY_MIN = 5
+RETRY_MAX = 300
+
+_ee_lock = threading.Lock()
+_ee_initialized = False
+_ee_error = None
+_ee_failures = 0
+_ee_retry_at = 0
+
+
+def initialize():
+    """
+    Initialize Earth Engine once per process. After a failure, the error is
+    re-raised without another attempt until a backoff has passed.
+    """
+    global _ee_initialized, _ee_error, _ee_failures, _ee_retry_at
+
+    with _ee_lock:
+        if _ee_initialized:
+            return
+        if _ee_error is not None and time.monotonic() < _ee_retry_at:
+            raise _ee_error
+        try:
+            with span("ee_initialize"):
+                geemap.ee_initialize()
+        except Exception as e:
+            _ee_error = e
+            _ee_failures += 1
+            backoff = min(RETRY_MIN * 2 ** (_ee_failures - 1), RETRY_MAX)
+            _ee_retry_at = time.monotonic() + backoff
+            raise
+        _ee_initialized = True
+        _ee_error = None
+        _ee_failures = 0
+
+
+def ee_available():
+    """
+    Whether Earth Engine can be initialized in this process
+    """
+    try:
+        initialize()
+    except Exception:
+        return False
+    return True
+
+
+def get_dataset(name):
+    """
+    Look up a registry entry by layer name
+    """
+    for registry in (DEMS, LANDCOVERS, LANDFORMS):
+        if name in registry:
+            return registry[name]
+    raise KeyError(name)
+
+
+@lru_cache(maxsize=None)
+def get_image(name):
+    """
+    Build the ee.Image for a registry entry, initializing Earth Engine on first use
+    """
+    data = get_dataset(name)
+    initialize()
+
+    if "collection" in data:
+        collection = ee.ImageCollection(data["asset"])
+        image = getattr(collection, data["collection"])()
+    else:
+        image = ee.Image(data["asset"])
+
+    if "select" in data:
+        image = image.select(data["select"])
+    if "rename" in data:
+        image = image.rename(data["rename"])
+
+    return image
+
+
+def vis_params(name, palette=None):
+    """
+    A mutable copy of a registry entry's vis params, optionally with another palette
+    """
+    vis = _thaw(get_dataset(name)["vis"])
+    if palette is not None:
+        vis["palette"] = list(palette)
+    return vis
+
+
+def derived_image(name, roi=None):
+    """
+    The image of a registry entry clipped to an ROI. Variants are memoized by
+    (layer, ROI), so reruns reuse the same expression instead of wrapping the
+    shared image in another clip.
+    """
+    image = get_image(name)
+    if roi is None:
+        return image
+
+    key = (name, fingerprint(roi))
+    derived = derived_cache.get(key)
+    if derived is None:
+        derived = image.clip(roi)
+        derived_cache.set(key, derived)
+    return derived
+
+
+def cog_path(name):
+    """
+    Path of the local COG of a registry entry, or None if it is missing.
+    Entries written by `python -m apps.cog` to the manifest take precedence.
+    """
+    filename = get_dataset(name)["cog"]
+    filename = read_manifest(COG_DIR).get(name, {}).get("path", filename)
+    path = os.path.join(COG_DIR, filename)
+    return path if os.path.exists(path) else None
+
+
+def backends(name):
+    """
+    Backends that can serve a registry entry, Earth Engine first
+    """
+    options = []
+    if ee_available():
+        options.append(EARTH_ENGINE)
+    if cog_path(name) is not None:
+        options.append(LOCAL_COG)
+    return options
+
+
+def local_tile_layer(name, vis=None):
+    """
+    Folium tile layer of a registry entry served from its local COG through
+    localtileserver, rendered with the entry's palette and min/max
+    """
+    from localtileserver import get_folium_tile_layer
+
+    vis = get_dataset(name)["vis"] if vis is None else vis
+    kwargs = {}
+    if "palette" in vis:
+        kwargs["colormap"] = ["#" + color.lstrip("#") for color in vis["palette"]]
+    if "min" in vis:
+        kwargs["vmin"] = vis["min"]
+    if "max" in vis:
+        kwargs["vmax"] = vis["max"]
+
+    return get_folium_tile_layer(cog_path(name), name=name, attr=name, **kwargs)
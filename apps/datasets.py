@@ -1,30 +1,18 @@
 import ee
 import geemap.foliumap as geemap
 import geemap.colormaps as cm
-import geopandas as gpd
 import streamlit as st
-
-
-@st.cache
-def uploaded_file_to_gdf(data):
-    import tempfile
-    import os
-    import uuid
-
-    _, file_extension = os.path.splitext(data.name)
-    file_id = str(uuid.uuid4())
-    file_path = os.path.join(tempfile.gettempdir(), f"{file_id}{file_extension}")
-
-    with open(file_path, "wb") as file:
-        file.write(data.getbuffer())
-
-    if file_path.lower().endswith(".kml"):
-        gpd.io.file.fiona.drvsupport.supported_drivers["KML"] = "rw"
-        gdf = gpd.read_file(file_path, driver="KML")
-    else:
-        gdf = gpd.read_file(file_path)
-
-    return gdf
+from .catalog import (
+    COUNTRIES,
+    add_resolved_layers,
+    layer_names,
+    legend_dict,
+)
+from .countries import load_countries
+from .map_state import MapState
+from .roi import upload_to_roi
+from .stats import bbox_area, roi_scale, water_area
+from .tracing import span
 
 
 def app():
@@ -44,11 +32,16 @@ def app():
     col1, col2 = st.columns([3, 1])
 
     Map = geemap.Map(Draw_export=False, locate_control=True, plugin_LatLngPopup=True)
-
-    roi = ee.FeatureCollection("users/giswqs/public/countries")
-    # countries = roi.aggregate_array("name").getInfo()
-    # countries.sort()
-    countries = ["United States of America"]
+    state = MapState("datasets")
+
+    roi = ee.FeatureCollection(COUNTRIES)
+    # Country names come from the local index written by `python -m apps.countries`;
+    # without it, listing them would cost an Earth Engine request per rerun.
+    country_index = load_countries()
+    if country_index is not None:
+        countries = country_index.names
+    else:
+        countries = ["United States of America"]
 
     lc_basemaps = [
         "ESA Global Land Cover 2020",
@@ -64,21 +57,28 @@ def app():
     basemaps = google_basemaps + lc_basemaps
     with col2:
 
-        latitude = st.number_input("Map center latitude", -90.0, 90.0, 40.0, step=0.5)
-        longitude = st.number_input(
-            "Map center longitude", -180.0, 180.0, -100.0, step=0.5
-        )
-        zoom = st.slider("Map zoom level", 1, 22, 4)
+        latitude, longitude, zoom = state.view_inputs()
 
+        centered = False
+        gdf = None
         select = st.checkbox("Select a country")
         if select:
             country = st.selectbox(
                 "Select a country from dropdown list",
                 countries,
-                index=countries.index("United States of America"),
+                index=(
+                    countries.index("United States of America")
+                    if "United States of America" in countries
+                    else 0
+                ),
             )
             st.session_state["ROI"] = roi.filter(ee.Filter.eq("name", country))
+            if country_index is not None and country in country_index:
+                state.select(country, lambda: country_index.view(country))
+                gdf = country_index.geometry(country)
+                centered = True
         else:
+            state.select(None)
 
             with st.expander("Click here to upload an ROI", False):
                 upload = st.file_uploader(
@@ -87,8 +87,14 @@ def app():
                 )
 
                 if upload:
-                    gdf = uploaded_file_to_gdf(upload)
-                    st.session_state["ROI"] = geemap.gdf_to_ee(gdf, geodesic=False)
+                    gdf, st.session_state["ROI"], stats = upload_to_roi(upload)
+                    removed = stats["vertices_before"] - stats["vertices_after"]
+                    saved = stats["bytes_before"] - stats["bytes_after"]
+                    if removed:
+                        st.caption(
+                            f"ROI simplified: {removed:,} vertices removed, "
+                            f"{saved:,} bytes saved"
+                        )
                     # Map.add_gdf(gdf, "ROI")
                 else:
                     st.session_state["ROI"] = roi
@@ -107,14 +113,14 @@ def app():
                 if st.session_state["ROI"] is not None:
                     dataset = dataset.clipToCollection(st.session_state["ROI"])
 
-                Map.addLayer(dataset, {}, "ESA Landcover")
+                state.add_layer(Map, dataset, {}, "ESA Landcover")
                 Map.add_legend(title="ESA Landcover", builtin_legend="ESA_WorldCover")
             elif basemap == "ESRI Global Land Cover 2020":
 
                 esri_lulc10 = ee.ImageCollection(
                     "projects/sat-io/open-datasets/landcover/ESRI_Global-LULC_10m"
                 )
-                legend_dict = {
+                esri_legend = {
                     "names": [
                         "Water",
                         "Trees",
@@ -141,12 +147,12 @@ def app():
                     ],
                 }
 
-                vis_params = {"min": 1, "max": 10, "palette": legend_dict["colors"]}
+                vis_params = {"min": 1, "max": 10, "palette": esri_legend["colors"]}
                 esri_lulc10 = esri_lulc10.mosaic()
 
                 if st.session_state["ROI"] is not None:
                     esri_lulc10 = esri_lulc10.clipToCollection(st.session_state["ROI"])
-                Map.addLayer(esri_lulc10, vis_params, "ESRI Global Land Cover")
+                state.add_layer(Map, esri_lulc10, vis_params, "ESRI Global Land Cover")
                 Map.add_legend(title="ESRI Landcover", builtin_legend="ESRI_LandCover")
 
             elif basemap == "US NLCD 2019":
@@ -155,7 +161,7 @@ def app():
                 )
                 if st.session_state["ROI"] is not None:
                     nlcd = nlcd.clipToCollection(st.session_state["ROI"])
-                Map.addLayer(nlcd, {}, "US NLCD 2019")
+                state.add_layer(Map, nlcd, {}, "US NLCD 2019")
                 Map.add_legend(title="NLCD Land Cover", builtin_legend="NLCD")
 
             elif basemap == "USDA NASS Cropland 2020":
@@ -169,7 +175,7 @@ def app():
                 if st.session_state["ROI"] is not None:
                     cropland = cropland.clipToCollection(st.session_state["ROI"])
 
-                Map.addLayer(cropland, {}, "USDA NASS Cropland 2020")
+                state.add_layer(Map, cropland, {}, "USDA NASS Cropland 2020")
 
             # elif "HydroSHEDS" in datasets:
             #     hydrolakes = ee.FeatureCollection(
@@ -191,128 +197,14 @@ def app():
     with col2:
         datasets = st.multiselect(
             "Select surface water datasets",
-            [
-                "ESA Land Use",
-                "JRC Max Water Extent",
-                "OpenStreetMap",
-                "HydroLakes",
-                "LAGOS",
-                "US NED Depressions",
-                "Global River Width",
-            ],
+            layer_names("surface_water"),
         )
 
-    # styles = {
-    #     "ESA Land Use": {
-    #         "color": "dca0dcff",
-    #         "width": width,
-    #         "fillColor": "e4bbe4ff",
-    #     },
-    #     "JRC Max Water Extent": {
-    #         "color": "ffc2cbff",
-    #         "width": width,
-    #         "fillColor": "fdd1d8ff",
-    #     },
-    #     "OpenStreetMap": {
-    #         "color": "bf03bfff",
-    #         "width": width,
-    #         "fillColor": "ebb2ebff",
-    #     },
-    #     "HydroLakes": {
-    #         "color": "4e0583ff",
-    #         "width": width,
-    #         "fillColor": "a47fbfff",
-    #     },
-    #     "LAGOS": {
-    #         "color": "8f228fff",
-    #         "width": width,
-    #         "fillColor": "cb99cbff",
-    #     },
-    #     "US NED Depressions": {
-    #         "color": "8d32e2ff",
-    #         "width": width,
-    #         "fillColor": "c394efff",
-    #     },
-    # }
-
-    width = 1
-    styles = {
-        "ESA Land Use": {
-            "color": "000000ff",
-            "width": width,
-            "fillColor": "dca0dcff",
-        },
-        "JRC Max Water Extent": {
-            "color": "000000ff",
-            "width": width,
-            "fillColor": "ffc2cbff",
-        },
-        "OpenStreetMap": {
-            "color": "000000ff",
-            "width": width,
-            "fillColor": "bf03bfff",
-        },
-        "HydroLakes": {
-            "color": "000000ff",
-            "width": width,
-            "fillColor": "4e0583ff",
-        },
-        "LAGOS": {
-            "color": "000000ff",
-            "width": width,
-            "fillColor": "8f228fff",
-        },
-        "US NED Depressions": {
-            "color": "000000ff",
-            "width": width,
-            "fillColor": "8d32e2ff",
-        },
-        "Global River Width": {
-            "color": "000000ff",
-            "width": width,
-            "fillColor": "0000ffff",
-        },
-    }
-
-    if "ESA Land Use" in datasets:
-        dataset = ee.FeatureCollection("users/giswqs/MRB/ESA_entireUS")
-        Map.addLayer(dataset.style(**styles["ESA Land Use"]), {}, "ESA Land Use")
-
-    if "JRC Max Water Extent" in datasets:
-        dataset = ee.FeatureCollection("users/giswqs/MRB/JRC_entireUS")
-        Map.addLayer(
-            dataset.style(**styles["JRC Max Water Extent"]), {}, "JRC Max Water Extent"
-        )
-
-    if "OpenStreetMap" in datasets:
-        dataset = ee.FeatureCollection("users/giswqs/MRB/OSM_entireUS")
-        Map.addLayer(dataset.style(**styles["OpenStreetMap"]), {}, "OpenStreetMap")
-
-    if "HydroLakes" in datasets:
-        dataset = ee.FeatureCollection("users/giswqs/MRB/HL_entireUS")
-        Map.addLayer(dataset.style(**styles["HydroLakes"]), {}, "HydroLakes")
-
-    if "LAGOS" in datasets:
-        dataset = ee.FeatureCollection("users/giswqs/MRB/LAGOS_entireUS")
-        Map.addLayer(dataset.style(**styles["LAGOS"]), {}, "LAGOS")
-
-    if "US NED Depressions" in datasets:
-        depressions = ee.FeatureCollection("users/giswqs/MRB/US_depressions")
-        Map.addLayer(
-            depressions.style(**styles["US NED Depressions"]), {}, "US NED Depressions"
-        )
+    pending = state.submit_tile_layers(datasets, st.session_state["ROI"])
 
     if datasets:
-        legend_datasets = datasets[:]
-        # if "Global River Width" in legend_datasets:
-        #     legend_datasets.remove("Global River Width")
-        legend_dict = {}
-        for dataset in legend_datasets:
-            legend_dict[dataset] = styles[dataset]["fillColor"][:6]
-
-        if len(legend_datasets) > 0:
-
-            Map.add_legend(title="Surface Water", legend_dict=legend_dict)
+        with span("legend"):
+            Map.add_legend(title="Surface Water", legend_dict=legend_dict(datasets))
 
     # if "JRC Global Surface Water" in datasets:
     #     jrc = ee.Image("JRC/GSW1_3/GlobalSurfaceWater")
@@ -325,35 +217,6 @@ def app():
     #     Map.addLayer(jrc, vis, "JRC Global Surface Water")
     #     Map.add_colorbar(vis, label="Surface water occurrence (%)")
 
-    if "Global River Width" in datasets:
-        water_mask = ee.ImageCollection(
-            "projects/sat-io/open-datasets/GRWL/water_mask_v01_01"
-        ).median()
-
-        grwl_summary = ee.FeatureCollection(
-            "projects/sat-io/open-datasets/GRWL/grwl_SummaryStats_v01_01"
-        )
-        grwl_water_vector = ee.FeatureCollection(
-            "projects/sat-io/open-datasets/GRWL/water_vector_v01_01"
-        )
-
-        if st.session_state["ROI"] is not None:
-            water_mask = water_mask.clipToCollection(st.session_state["ROI"])
-            grwl_summary = grwl_summary.filterBounds(st.session_state["ROI"])
-
-        Map.addLayer(water_mask, {"palette": "blue"}, "GRWL RIver Mask")
-        Map.addLayer(
-            grwl_water_vector.style(**{"fillColor": "00000000", "color": "FF5500"}),
-            {},
-            "GRWL Centerline",
-            False,
-        )
-        Map.addLayer(
-            grwl_summary.style(**{"fillColor": "00000000", "color": "EE5500"}),
-            {},
-            "GRWL Centerline Simplified",
-        )
-
     show = False
     if select and country is not None:
         name = country
@@ -368,42 +231,47 @@ def app():
     else:
         name = "World"
 
-    Map.addLayer(st.session_state["ROI"].style(**style), {}, name, show)
-    Map.centerObject(st.session_state["ROI"])
+    with col2:
+        wbd = st.multiselect("Select watershed boundaries", layer_names("watersheds"))
+        pending_wbd = state.submit_tile_layers(wbd, group="watersheds")
+        # Statistics over the whole world would time out or silently coarsen.
+        if select or upload:
+            show_stats = st.checkbox("Compute water area statistics")
+        else:
+            show_stats = False
+            st.caption("Select a country or upload an ROI for water area statistics")
+
+    errors = add_resolved_layers(Map, pending)
+    state.add_layer(Map, st.session_state["ROI"].style(**style), {}, name, show)
+    if not centered:
+        state.center_object(Map, st.session_state["ROI"])
+    errors.update(add_resolved_layers(Map, pending_wbd))
 
     with col2:
-        wbds = [
-            "NHD-HUC2",
-            "NHD-HUC4",
-            "NHD-HUC6",
-            "NHD-HUC8",
-            "NHD-HUC10",
-        ]
-        wbd = st.multiselect("Select watershed boundaries", wbds)
-
-        if "NHD-HUC2" in wbd:
-            huc2 = ee.FeatureCollection("USGS/WBD/2017/HUC02")
-            Map.addLayer(huc2.style(**{"fillColor": "00000000"}), {}, "NHD-HUC2")
-
-        if "NHD-HUC4" in wbd:
-            huc4 = ee.FeatureCollection("USGS/WBD/2017/HUC04")
-            Map.addLayer(huc4.style(**{"fillColor": "00000000"}), {}, "NHD-HUC4")
-
-        if "NHD-HUC6" in wbd:
-            huc6 = ee.FeatureCollection("USGS/WBD/2017/HUC06")
-            Map.addLayer(huc6.style(**{"fillColor": "00000000"}), {}, "NHD-HUC6")
-
-        if "NHD-HUC8" in wbd:
-            huc8 = ee.FeatureCollection("USGS/WBD/2017/HUC08")
-            Map.addLayer(huc8.style(**{"fillColor": "00000000"}), {}, "NHD-HUC8")
-
-        if "NHD-HUC10" in wbd:
-            huc10 = ee.FeatureCollection("USGS/WBD/2017/HUC10")
-            Map.addLayer(huc10.style(**{"fillColor": "00000000"}), {}, "NHD-HUC10")
+        for layer_name, error in errors.items():
+            st.error(f"Failed to load {layer_name}: {error}")
 
     with col1:
         Map.set_center(longitude, latitude, zoom)
-        Map.to_streamlit(height=680)
+        state.render(
+            Map, height=680, basemap=basemap, center=(latitude, longitude, zoom)
+        )
+
+        if show_stats:
+            try:
+                if gdf is not None:
+                    area = gdf.to_crs(epsg=6933).area.sum()
+                else:
+                    (south, west), (north, east) = state.bounds(st.session_state["ROI"])
+                    area = bbox_area((west, south, east, north))
+                scale = roi_scale(area)
+                with st.spinner("Computing water area..."):
+                    df = water_area(st.session_state["ROI"], scale=scale)
+                st.caption(f"Computed at {scale} m resolution")
+                st.dataframe(df)
+                st.bar_chart(df.set_index("Dataset")["Water area (km²)"])
+            except Exception as e:
+                st.error(f"Failed to compute statistics: {e}")
 
     with col2:
         with st.expander("Data Sources"):
@@ -0,0 +1,108 @@
+"""
+Import-time profile of each page module, from `python -X importtime` in a fresh
+interpreter per page, so the cost of opening a page cold can be tracked.
+
+    python -m apps.importtime --out importtime.json
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+PAGES = ["home", "datasets", "split"]
+# Modules a page should only load when it needs them.
+HEAVY = ["ee", "geemap", "geopandas", "folium", "leafmap", "keplergl", "pydeck"]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def profile(statement):
+    """
+    Run an import statement under -X importtime and return
+    {module: (self µs, cumulative µs, depth)} for the first import of each module
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    modules = {}
+    for line in process.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            modules.setdefault(
+                name, (int(own), int(cumulative), (len(indent) - 1) // 2)
+            )
+    return modules
+
+
+def page_report(page, baseline=(), top=10):
+    """
+    Cumulative import time of one page module on top of the baseline modules,
+    the heavy packages it loads and its slowest direct imports
+    """
+    try:
+        modules = profile(f"import apps.{page}")
+    except RuntimeError as e:
+        return {"error": str(e)}
+    extra = {name: times for name, times in modules.items() if name not in baseline}
+    top_level = sorted(
+        (
+            (cumulative, name)
+            for name, (_, cumulative, depth) in extra.items()
+            if depth == 1
+        ),
+        reverse=True,
+    )
+    return {
+        "total_ms": round(sum(own for own, _, _ in extra.values()) / 1e3, 1),
+        "modules": len(extra),
+        "heavy": [name for name in HEAVY if name in modules],
+        "slowest_ms": {name: round(us / 1e3, 1) for us, name in top_level[:top]},
+    }
+
+
+def report(pages=PAGES):
+    """
+    Import profile of every page, measured on top of `import streamlit`, which
+    the app has already paid for before any page is selected
+    """
+    baseline = profile("import streamlit")
+    result = {
+        "python": sys.version.split()[0],
+        "streamlit_ms": round(sum(own for own, _, _ in baseline.values()) / 1e3, 1),
+        "pages": {},
+    }
+    for page in pages:
+        result["pages"][page] = page_report(page, baseline)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pages", nargs="*", default=PAGES)
+    parser.add_argument("--out", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    result = report(args.pages)
+    text = json.dumps(result, indent=4)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+    heavy = result["pages"].get("home", {}).get("heavy")
+    if heavy:
+        sys.exit(f"home imports {', '.join(heavy)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""
+Headless load test of the map pages: simulated sessions driven through
+Streamlit's AppTest against a local Earth Engine stub with injected latency,
+ramped up in concurrency.
+
+    python -m apps.loadtest --users 1 2 4 8 --latency 0.3 --out loadtest.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each page runs on its own, as streamlit_app.py would run it once selected.
+PAGE_SCRIPT = """
+import sys
+sys.path.insert(0, {root!r})
+import importlib
+importlib.import_module("apps.{page}").app()
+"""
+
+
+class _Stub:
+    """
+    Absorbs any attribute access or call, for the parts of the Earth Engine
+    API the app only passes through (ee.data, authentication, ...)
+    """
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _Stub()
+
+    def __call__(self, *args, **kwargs):
+        return _Stub()
+
+
+class StubEE:
+    """
+    A stand-in for the `ee` module. Objects are lazy expressions that serialize
+    deterministically; getInfo and getMapId sleep for the injected latency,
+    count as server calls and return plausible results.
+    """
+
+    def __init__(self, latency=0.3, jitter=0.5, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def call(self, method):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            delay = self.latency * (1 + self._random.uniform(-1, 1) * self.jitter)
+        time.sleep(max(delay, 0))
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.calls)
+
+    def module(self):
+        stub = self
+
+        class Meta(type):
+            # Static methods such as ee.Image.pixelArea() or ee.Filter.eq().
+            def __getattr__(cls, name):
+                if name.startswith("_"):
+                    raise AttributeError(name)
+                return lambda *args, **kwargs: cls(None, name, args, kwargs)
+
+        class ComputedObject(metaclass=Meta):
+            def __init__(self, parent=None, op=None, args=(), kwargs=None):
+                if op is None:
+                    # A constructor call such as ee.Image("asset/id").
+                    parent, op, args = None, type(self).__name__, (parent,)
+                self._graph = [
+                    parent._graph if isinstance(parent, ComputedObject) else None,
+                    op,
+                    [_graph(arg) for arg in args],
+                    {key: _graph(value) for key, value in (kwargs or {}).items()},
+                ]
+                self._op = op
+
+            def __getattr__(self, name):
+                if name.startswith("_"):
+                    raise AttributeError(name)
+                cls = type(self)
+                return lambda *args, **kwargs: cls(self, name, args, kwargs)
+
+            def serialize(self, *args, **kwargs):
+                return json.dumps(self._graph, sort_keys=True, default=str)
+
+            def getInfo(self):
+                stub.call("getInfo")
+                return _info(self._op)
+
+            def getMapId(self, vis_params=None):
+                stub.call("getMapId")
+                digest = hashlib.sha1(
+                    (self.serialize() + json.dumps(vis_params, default=str)).encode()
+                ).hexdigest()
+                url = f"https://earthengine.test/map/{digest}/tiles/{{z}}/{{x}}/{{y}}"
+                return {
+                    "mapid": digest,
+                    "token": "",
+                    "tile_fetcher": types.SimpleNamespace(url_format=url),
+                }
+
+        def _graph(value):
+            if isinstance(value, ComputedObject):
+                return value._graph
+            return value
+
+        module = types.ModuleType("ee")
+        ComputedObject.__module__ = "ee.computedobject"
+        module.ComputedObject = ComputedObject
+        for name in (
+            "Element",
+            "Image",
+            "ImageCollection",
+            "Feature",
+            "FeatureCollection",
+            "Geometry",
+            "Filter",
+            "Reducer",
+            "List",
+            "Number",
+            "String",
+            "Dictionary",
+            "Date",
+        ):
+            cls = Meta(name, (ComputedObject,), {"__module__": f"ee.{name.lower()}"})
+            setattr(module, name, cls)
+        module.Initialize = module.Authenticate = lambda *args, **kwargs: None
+        module.data = _Stub()
+        module.serializer = types.SimpleNamespace(toJSON=lambda obj: obj.serialize())
+        module.deserializer = types.SimpleNamespace(
+            fromJSON=lambda text: ComputedObject(None, "Deserialized", (text,))
+        )
+        module.__version__ = "0.0.0-stub"
+
+        def __getattr__(name):
+            # Dunder lookups such as __file__ must fail as on a real module,
+            # or inspect, which Streamlit calls, trips over the stub.
+            if name.startswith("__"):
+                raise AttributeError(name)
+            return _Stub()
+
+        module.__getattr__ = __getattr__
+        return module
+
+
+def _info(op):
+    """
+    Result of getInfo on an expression, by its last operation
+    """
+    if op == "bounds":
+        return {
+            "type": "Polygon",
+            "coordinates": [[[-125, 24], [-66, 24], [-66, 50], [-125, 50], [-125, 24]]],
+        }
+    if op == "reduceRegion":
+        return {"ROI": 8.0e6, **{f"b{i}": 1.0e5 * (i + 1) for i in range(32)}}
+    if op == "aggregate_array":
+        return ["United States of America"]
+    return None
+
+
+def install_stub(latency=0.3, jitter=0.5):
+    """
+    Replace the ee module with a StubEE before any page imports it
+    """
+    if "ee" in sys.modules and not hasattr(sys.modules["ee"], "_stub"):
+        raise RuntimeError("ee was imported before the stub was installed")
+    stub = StubEE(latency, jitter)
+    module = stub.module()
+    module._stub = stub
+    sys.modules["ee"] = module
+
+    from . import data_dict
+
+    data_dict._ee_initialized = True
+    return stub
+
+
+def rss_mb():
+    """
+    Resident memory of this process in MB
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except OSError:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _widget(at, kind, label):
+    return next(widget for widget in getattr(at, kind) if widget.label == label)
+
+
+def _other(widget, offset=1):
+    options = list(widget.options)
+    return options[(options.index(widget.value) + offset) % len(options)]
+
+
+# Scripted sessions: each step changes one widget and reruns the page.
+def datasets_session(at):
+    yield "open"
+    basemap = _widget(at, "selectbox", "Select a basemap")
+    basemap.set_value("OpenStreetMap")
+    yield "basemap"
+    datasets = _widget(at, "multiselect", "Select surface water datasets")
+    datasets.set_value(list(datasets.options)[:3])
+    yield "datasets"
+    # AppTest cannot drive st.file_uploader, so the ROI comes from the country
+    # picker, which takes the same ROI code path through the layers and stats.
+    _widget(at, "checkbox", "Select a country").check()
+    yield "roi"
+    _widget(at, "checkbox", "Compute water area statistics").check()
+    yield "stats"
+
+
+def split_session(at):
+    yield "open"
+    left = _widget(at, "selectbox", "Select a layer on the left")
+    left.set_value(_other(left, 2))
+    yield "left_layer"
+    right = _widget(at, "selectbox", "Select a layer on the right")
+    right.set_value(_other(right, 2))
+    yield "right_layer"
+    _widget(at, "checkbox", "Select a country").check()
+    yield "roi"
+
+
+SESSIONS = {"datasets": datasets_session, "split": split_session}
+
+
+def run_session(page, timeout=120):
+    """
+    Run one scripted session. Returns the AppTest, which holds the session's
+    state, and a list of (step, seconds, error) per rerun.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_string(
+        PAGE_SCRIPT.format(root=ROOT, page=page), default_timeout=timeout
+    )
+    reruns = []
+    for step in SESSIONS[page](at):
+        start = time.perf_counter()
+        at.run()
+        seconds = time.perf_counter() - start
+        error = at.exception[0].message if at.exception else None
+        reruns.append((f"{page}:{step}", seconds, error))
+        if error:
+            break
+    return at, reruns
+
+
+def run_level(users, pages, stub=None):
+    """
+    Run `users` concurrent sessions, cycling through pages, and summarize them
+    """
+    before_rss = rss_mb()
+    before_calls = stub.snapshot() if stub else {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        results = list(
+            executor.map(run_session, [pages[i % len(pages)] for i in range(users)])
+        )
+    seconds = time.perf_counter() - start
+    after_rss = rss_mb()
+
+    reruns = [rerun for _, session in results for rerun in session]
+    latencies = np.array([rerun_seconds for _, rerun_seconds, _ in reruns]) * 1e3
+    errors = [f"{step}: {error}" for step, _, error in reruns if error]
+    level = {
+        "users": users,
+        "reruns": len(reruns),
+        "errors": errors,
+        "seconds": seconds,
+        "reruns_per_second": len(reruns) / seconds,
+        "latency_ms": {
+            f"p{q}": float(np.percentile(latencies, q)) for q in (50, 95, 99)
+        },
+        "rss_mb": after_rss,
+        "rss_mb_per_session": (after_rss - before_rss) / users,
+    }
+    level["latency_ms"]["max"] = float(latencies.max())
+    if stub is not None:
+        calls = stub.snapshot()
+        level["ee_calls_per_rerun"] = {
+            method: (count - before_calls.get(method, 0)) / len(reruns)
+            for method, count in calls.items()
+        }
+    del results
+    return level
+
+
+def loadtest(users=(1, 2, 4, 8), pages=("datasets", "split"), stub=None):
+    result = {
+        "python": sys.version.split()[0],
+        "pages": list(pages),
+        "ee": "stub" if stub else "earthengine",
+        "latency_s": stub.latency if stub else None,
+        "levels": [],
+    }
+    for count in users:
+        level = run_level(count, list(pages), stub)
+        print(
+            f"{count} users: {level['reruns_per_second']:.2f} reruns/s, "
+            f"p95 {level['latency_ms']['p95']:,.0f} ms, "
+            f"{len(level['errors'])} errors",
+            file=sys.stderr,
+        )
+        result["levels"].append(level)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--pages", nargs="+", default=list(SESSIONS))
+    parser.add_argument(
+        "--latency", type=float, default=0.3, help="mean EE call latency in s"
+    )
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument(
+        "--real-ee", action="store_true", help="call Earth Engine instead of a stub"
+    )
+    parser.add_argument("--out", help="write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    stub = None if args.real_ee else install_stub(args.latency, args.jitter)
+    result = loadtest(args.users, args.pages, stub)
+    text = json.dumps(result, indent=4)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
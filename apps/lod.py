@@ -0,0 +1,109 @@
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+# Minimum zoom level of each level of detail.
+ZOOM_BANDS = (2, 5, 8, 11, 14)
+MAX_PAYLOAD_BYTES = 5 * 1024 * 1024
+
+
+def pixel_size(zoom):
+    """
+    Width of one 256 px web map tile pixel in degrees at a zoom level
+    """
+    return 360 / (256 * 2**zoom)
+
+
+def viewport_bbox(lon, lat, zoom, width=1024, height=768):
+    """
+    Approximate (minx, miny, maxx, maxy) in degrees of a width x height px map
+    view centered at lon, lat
+    """
+    half_width = width / 2 * pixel_size(zoom)
+    half_height = height / 2 * pixel_size(zoom) * math.cos(math.radians(lat))
+    return (
+        lon - half_width,
+        max(lat - half_height, -90),
+        lon + half_width,
+        min(lat + half_height, 90),
+    )
+
+
+def bbox_zoom(bbox, width=1024, height=768, max_zoom=22):
+    """
+    Highest zoom level at which a width x height px view shows the whole of
+    bbox, the inverse of viewport_bbox
+    """
+    minx, miny, maxx, maxy = bbox
+    lat = (miny + maxy) / 2
+    span_x = max(maxx - minx, 1e-9) / width
+    span_y = max(maxy - miny, 1e-9) / height / max(math.cos(math.radians(lat)), 1e-3)
+    zoom = math.floor(math.log2(360 / 256 / max(span_x, span_y)))
+    return min(max(zoom, 1), max_zoom)
+
+
+def payload_size(gdf):
+    """
+    Size in bytes of the GeoJSON a map backend sends to the browser
+    """
+    return len(gdf.to_json().encode("utf-8"))
+
+
+def build_lods(gdf, zooms=ZOOM_BANDS):
+    """
+    Precompute simplified copies of a GeoDataFrame, one per zoom band, each
+    simplified to one pixel at the band's minimum zoom
+    """
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    return {
+        zoom: gdf.set_geometry(
+            gdf.geometry.simplify(pixel_size(zoom), preserve_topology=True)
+        )
+        for zoom in zooms
+    }
+
+
+def select_lod(lods, zoom, bbox=None, max_bytes=MAX_PAYLOAD_BYTES, index=None):
+    """
+    Pick the most detailed level whose band starts at or below `zoom`, keep the
+    features intersecting `bbox` and coarsen until the payload fits in max_bytes.
+    `index` is an optional SpatialIndex of the features, in level row order.
+    Returns the GeoDataFrame, the chosen level and its payload size.
+    """
+    positions = None
+    if bbox is not None and index is not None:
+        positions = index.query(bbox)
+
+    levels = sorted(lods)
+    candidates = [level for level in levels if level <= zoom] or levels[:1]
+
+    for level in reversed(candidates):
+        gdf = lods[level]
+        if positions is not None:
+            gdf = gdf.iloc[positions]
+        elif bbox is not None:
+            gdf = gdf.cx[bbox[0] : bbox[2], bbox[1] : bbox[3]]
+        size = payload_size(gdf)
+        if size <= max_bytes:
+            logger.info("LOD zoom %s: %s features, %s bytes", level, len(gdf), size)
+            return gdf, level, size
+
+    # Even the coarsest level is too big: simplify further, then drop features.
+    tolerance = pixel_size(level)
+    while size > max_bytes and tolerance < 1:
+        tolerance *= 2
+        gdf = gdf.set_geometry(gdf.geometry.simplify(tolerance, preserve_topology=True))
+        size = payload_size(gdf)
+    while size > max_bytes and len(gdf) > 0:
+        gdf = gdf.iloc[: int(len(gdf) * max_bytes / size * 0.9)]
+        size = payload_size(gdf)
+
+    logger.warning(
+        "LOD zoom %s over budget, coarsened to %s features, %s bytes",
+        level,
+        len(gdf),
+        size,
+    )
+    return gdf, level, size
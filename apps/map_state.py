@@ -0,0 +1,156 @@
+from concurrent.futures import Future
+
+import streamlit as st
+import streamlit.components.v1 as components
+from .cache import cached_tile_layer, fingerprint, object_key
+from .catalog import get_entry, layer_key, submit_tile_layers
+from .tracing import span
+
+
+class MapState:
+    """
+    Layers and HTML of the previous render of a page, kept in st.session_state.
+    A rerun builds a fresh geemap.Map, but layers whose key is unchanged are
+    reused instead of recomputed, and the HTML is only re-serialized when the
+    layer keys or view differ from the last render.
+    """
+
+    def __init__(self, page):
+        state_key = f"map_state_{page}"
+        if state_key not in st.session_state:
+            st.session_state[state_key] = {
+                "layers": {},
+                "signature": None,
+                "html": None,
+            }
+        self._state = st.session_state[state_key]
+        self._view_keys = [
+            f"{page}_{name}" for name in ("latitude", "longitude", "zoom")
+        ]
+        self._keys = []
+        self._pending = {}
+
+    def view_inputs(self, latitude=40.0, longitude=-100.0, zoom=4):
+        """
+        Map center latitude, longitude and zoom widgets. A view set by select()
+        replaces their values; otherwise they keep what the user entered.
+        """
+        view = self._state.pop("view", None)
+        for key, value in zip(self._view_keys, view or (latitude, longitude, zoom)):
+            if view is not None or key not in st.session_state:
+                st.session_state[key] = value
+        latitude_key, longitude_key, zoom_key = self._view_keys
+        return (
+            st.number_input(
+                "Map center latitude", -90.0, 90.0, step=0.5, key=latitude_key
+            ),
+            st.number_input(
+                "Map center longitude", -180.0, 180.0, step=0.5, key=longitude_key
+            ),
+            st.slider("Map zoom level", 1, 22, key=zoom_key),
+        )
+
+    def select(self, selection, view=None):
+        """
+        Record the selected ROI. When it differs from the previous rerun's,
+        `view()` gives the (latitude, longitude, zoom) to move view_inputs() to,
+        which reruns the page so the widgets show it.
+        """
+        if self._state.get("selection") == selection:
+            return
+        self._state["selection"] = selection
+        if view is not None:
+            self._state["view"] = view()
+            st.rerun()
+
+    def memo(self, key, build):
+        """
+        Return the value stored under key by a previous render, or build it
+        """
+        self._keys.append(key)
+        layers = self._state["layers"]
+        if key not in layers:
+            layers[key] = build()
+        return layers[key]
+
+    def tile_layer(
+        self, ee_object, vis_params=None, name="Layer untitled", shown=True, opacity=1.0
+    ):
+        key = ("ee", object_key(ee_object, vis_params), name, shown, opacity)
+        return self.memo(
+            key,
+            lambda: cached_tile_layer(ee_object, vis_params, name, shown, opacity),
+        )
+
+    def add_layer(
+        self, m, ee_object, vis_params=None, name="Layer untitled", shown=True
+    ):
+        """
+        Drop-in replacement for Map.addLayer that reuses the previous render's layer
+        """
+        layer = self.tile_layer(ee_object, vis_params, name, shown)
+        layer.add_to(m)
+        return layer
+
+    def submit_tile_layers(self, names, roi=None, group="surface_water"):
+        """
+        Like catalog.submit_tile_layers, but entries whose layer keys are unchanged
+        since the previous render come back as already completed futures
+        """
+        pending = []
+        for name in names:
+            specs = get_entry(name, group)["layers"]
+            key = ("catalog", group, name, tuple(layer_key(s, roi) for s in specs))
+            self._keys.append(key)
+            layers = self._state["layers"]
+            if key in layers:
+                future = Future()
+                future.set_result(layers[key])
+            else:
+                [(_, future)] = submit_tile_layers([name], roi, group)
+                self._pending[key] = future
+            pending.append((name, future))
+        return pending
+
+    def bounds(self, ee_object):
+        """
+        [[south, west], [north, east]] of an Earth Engine object, fetched once
+        per object
+        """
+
+        def bounds():
+            with span("getInfo_bounds"):
+                coords = ee_object.geometry().bounds(1).getInfo()
+            coords = coords["coordinates"][0]
+            lons, lats = zip(*coords)
+            return [[min(lats), min(lons)], [max(lats), max(lons)]]
+
+        return self.memo(("bounds", fingerprint(ee_object)), bounds)
+
+    def center_object(self, m, ee_object):
+        """
+        Fit the map to an Earth Engine object, fetching its bounds once per object
+        """
+        m.fit_bounds(self.bounds(ee_object))
+
+    def render(self, m, height=600, **view):
+        """
+        Show the map, reusing the previous HTML when neither the layers nor the
+        view changed. `view` must hold every widget value that changes the map
+        other than the layers added through this object, e.g. basemap and center.
+        Layers not used in this render are dropped.
+        """
+        layers = self._state["layers"]
+        for key, future in self._pending.items():
+            if future.exception() is None:
+                layers[key] = future.result()
+        # Keys whose layer failed are left out, so a later success re-serializes.
+        keys = tuple(key for key in self._keys if key in layers)
+        signature = (keys, sorted(view.items()))
+        if signature != self._state["signature"]:
+            with span("map_serialization"):
+                self._state["html"] = m.to_html()
+            self._state["signature"] = signature
+        for key in set(layers) - set(keys):
+            del layers[key]
+        return components.html(self._state["html"], height=height)
@@ -0,0 +1,198 @@
+"""
+Pre-warm the tile cache for the default map views of the layer catalog.
+
+    GSWIS_TILE_CACHE=data/tiles.mbtiles python -m apps.prewarm --zoom 4 8
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import ee
+from . import tile_proxy
+from .cache import get_tile_url
+from .catalog import COUNTRIES, build_ee_object, get_entry, layer_key, load_catalog
+from .data_dict import initialize
+
+# Contiguous US, the extent of the default lat 40, lon -100, zoom 4 view.
+DEFAULT_BBOX = (-125.0, 24.0, -66.0, 50.0)
+
+
+def lonlat_to_tile(lon, lat, z):
+    lat = max(min(lat, 85.0511), -85.0511)
+    n = 2**z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def enumerate_tiles(bbox, min_zoom, max_zoom):
+    """
+    Yield (z, x, y) for every tile covering bbox from min_zoom to max_zoom
+    """
+    west, south, east, north = bbox
+    for z in range(min_zoom, max_zoom + 1):
+        x0, y0 = lonlat_to_tile(west, north, z)
+        x1, y1 = lonlat_to_tile(east, south, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+
+class RateLimiter:
+    """
+    Token bucket allowing `rate` acquisitions per second across threads
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def fetch_with_retry(layer, z, x, y, limiter, retries=4, backoff=0.5):
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        try:
+            return tile_proxy.get_tile(layer, z, x, y)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt * (1 + random.random()))
+
+
+def register_layers(names, roi):
+    """
+    Mint map IDs for catalog layers and register them with the tile proxy.
+    Returns {layer fingerprint: display name}.
+    """
+    layers = {}
+    for group, name in names:
+        for spec in get_entry(name, group)["layers"]:
+            key = layer_key(spec, roi)
+            url = get_tile_url(build_ee_object(spec, roi), spec.get("vis", {}), key)
+            tile_proxy.proxied_url(key, url)
+            layers[tile_proxy.layer_fingerprint(key)] = spec.get("name", name)
+    return layers
+
+
+def load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return set(json.load(f)["completed"])
+    return set()
+
+
+def save_checkpoint(path, completed):
+    if path:
+        with open(path, "w") as f:
+            json.dump({"completed": sorted(completed)}, f)
+
+
+def prewarm(
+    layers,
+    bbox=DEFAULT_BBOX,
+    min_zoom=4,
+    max_zoom=8,
+    rate=20.0,
+    workers=8,
+    checkpoint=None,
+):
+    """
+    Fill the tile store for every layer over bbox and the zoom range. Layers that
+    finished in an earlier run are skipped, and so is any tile already stored.
+    Returns a summary dict.
+    """
+    store = tile_proxy.get_store()
+    completed = load_checkpoint(checkpoint)
+    limiter = RateLimiter(rate)
+    tiles = list(enumerate_tiles(bbox, min_zoom, max_zoom))
+    summary = {"fetched": 0, "cached": 0, "failed": 0, "seconds": 0.0}
+    start = time.monotonic()
+
+    for layer, name in layers.items():
+        if layer in completed:
+            print(f"{name}: already complete")
+            continue
+
+        todo = [tile for tile in tiles if store.get(layer, *tile) is None]
+        summary["cached"] += len(tiles) - len(todo)
+        failed = 0
+        layer_start = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(fetch_with_retry, layer, *tile, limiter)
+                for tile in todo
+            ]
+            for i, future in enumerate(as_completed(futures), 1):
+                if future.exception() is not None:
+                    failed += 1
+                if i % 100 == 0 or i == len(futures):
+                    rate_now = i / max(time.monotonic() - layer_start, 1e-9)
+                    print(
+                        f"{name}: {i}/{len(todo)} tiles, "
+                        f"{rate_now:.1f} tiles/s, {failed} failed"
+                    )
+
+        summary["fetched"] += len(todo) - failed
+        summary["failed"] += failed
+        if failed == 0:
+            completed.add(layer)
+            save_checkpoint(checkpoint, completed)
+
+    summary["seconds"] = time.monotonic() - start
+    summary["tiles_per_second"] = summary["fetched"] / max(summary["seconds"], 1e-9)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--zoom", nargs=2, type=int, default=[4, 8])
+    parser.add_argument("--bbox", nargs=4, type=float, default=list(DEFAULT_BBOX))
+    parser.add_argument("--layers", nargs="*", help="catalog names, default all")
+    parser.add_argument("--rate", type=float, default=20.0, help="tiles per second")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--checkpoint", default="prewarm_checkpoint.json")
+    parser.add_argument("--cache", default=tile_proxy.TILE_CACHE_PATH)
+    args = parser.parse_args(argv)
+
+    if not args.cache:
+        parser.error("set GSWIS_TILE_CACHE or pass --cache")
+    tile_proxy.TILE_CACHE_PATH = args.cache
+
+    names = [
+        (group, name)
+        for group, entries in load_catalog().items()
+        for name in entries
+        if not args.layers or name in args.layers
+    ]
+    initialize()
+    layers = register_layers(names, ee.FeatureCollection(COUNTRIES))
+    summary = prewarm(
+        layers,
+        bbox=args.bbox,
+        min_zoom=args.zoom[0],
+        max_zoom=args.zoom[1],
+        rate=args.rate,
+        workers=args.workers,
+        checkpoint=args.checkpoint,
+    )
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import geemap.foliumap as geemap
+import geopandas as gpd
+import shapely
+from .cache import make_cache
+from .tracing import span
+from .upload import ingest_upload, read_vector, upload_digest
+
+# Parsed and converted uploads keyed by the SHA-256 of their bytes, bounded by size.
+roi_cache = make_cache("roi", maxsize=32, ttl=None, maxbytes=200 * 1024 * 1024)
+
+
+def uploaded_file_to_gdf(data):
+    """
+    Read an uploaded GeoJSON, KML or zipped shapefile into a GeoDataFrame
+    """
+    with ingest_upload(data, data.name) as (file_path, fmt):
+        return read_vector(file_path, fmt)
+
+
+def simplify_roi(gdf, max_vertices=5000, tolerance=None, min_area=900):
+    """
+    Prepare an ROI for Earth Engine: reproject to EPSG:4326, dissolve all features into
+    one and drop polygon parts smaller than `min_area` m² (by default one 30 m pixel,
+    measured in the equal-area EPSG:6933). Only if more than `max_vertices` remain is it
+    simplified (topology-preserving), starting from `tolerance` in degrees.
+    Returns the simplified GeoDataFrame and a dict of vertex and byte counts.
+    """
+    if gdf.crs is None:
+        gdf = gdf.set_crs(epsg=4326)
+    elif gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+
+    stats = {
+        "vertices_before": int(
+            shapely.get_num_coordinates(gdf.geometry.to_numpy()).sum()
+        ),
+        "bytes_before": len(gdf.to_json()),
+    }
+
+    parts = shapely.get_parts(shapely.union_all(gdf.geometry.to_numpy()))
+    if min_area:
+        areas = gpd.GeoSeries(parts, crs="EPSG:4326").to_crs(epsg=6933).area
+        if (areas >= min_area).any():
+            parts = parts[areas.to_numpy() >= min_area]
+    geom = shapely.union_all(parts)
+
+    applied = 0
+    if shapely.get_num_coordinates(geom) > max_vertices:
+        xmin, ymin, xmax, ymax = shapely.bounds(geom)
+        tolerance = tolerance or max(xmax - xmin, ymax - ymin) / max_vertices
+        simplified = geom
+        for _ in range(20):
+            simplified = shapely.simplify(geom, tolerance, preserve_topology=True)
+            applied = tolerance
+            if shapely.get_num_coordinates(simplified) <= max_vertices:
+                break
+            tolerance *= 2
+        geom = simplified
+
+    result = gpd.GeoDataFrame(geometry=[geom], crs="EPSG:4326")
+    stats["vertices_after"] = int(shapely.get_num_coordinates(geom))
+    stats["bytes_after"] = len(result.to_json())
+    stats["tolerance"] = float(applied)
+    return result, stats
+
+
+def upload_to_roi(data, max_vertices=5000):
+    """
+    Return the simplified GeoDataFrame, ee.FeatureCollection and simplification
+    stats of an uploaded ROI. Each distinct upload is parsed, simplified and
+    converted to Earth Engine only once.
+    """
+    digest = upload_digest(data)
+    parsed = roi_cache.get(digest)
+    if parsed is None:
+        parsed = uploaded_file_to_gdf(data)
+        roi_cache.set(digest, parsed, nbytes=data.size)
+
+    key = (digest, max_vertices)
+    roi = roi_cache.get(key)
+    if roi is None:
+        gdf, stats = simplify_roi(parsed, max_vertices=max_vertices)
+        with span("gdf_to_ee"):
+            fc = geemap.gdf_to_ee(gdf, geodesic=False)
+        roi = (gdf, fc, stats)
+        roi_cache.set(key, roi, nbytes=stats["bytes_after"])
+    return roi
@@ -0,0 +1,206 @@
+"""
+Persistent bounding-box R-tree and HUC prefix index for local vector layers, so
+only the features in the map extent (or under a HUC code) are serialized.
+
+    python -m apps.spatial_index data/HUC10.parquet --benchmark
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import shapely
+from .cache import TTLCache
+
+INDEX_DIR = os.path.join(os.environ.get("GSWIS_DATA_DIR", "data"), "index")
+# Rough memory per feature of the STRtree: its box geometry and tree node.
+TREE_BYTES = 200
+
+# Indexes built by get_index, least recently used evicted first.
+_indexes = TTLCache(maxsize=64, ttl=None, maxbytes=256 * 1024 * 1024)
+
+
+class PrefixIndex:
+    """
+    Prefix lookups over string keys. The keys are sorted once, so all keys under
+    a prefix (a trie subtree) form one contiguous run found by binary search.
+    """
+
+    def __init__(self, keys):
+        keys = np.asarray(keys, dtype=str)
+        self.order = np.argsort(keys, kind="stable")
+        self.sorted = keys[self.order]
+
+    def lookup(self, prefix):
+        if not prefix:
+            raise ValueError("empty prefix")
+        start = np.searchsorted(self.sorted, prefix, side="left")
+        stop = np.searchsorted(self.sorted, prefix + "\U0010ffff", side="left")
+        return self.order[start:stop]
+
+
+class SpatialIndex:
+    """
+    STRtree over feature bounding boxes, with an optional prefix index on a key
+    column. Query results are row positions into the indexed GeoDataFrame.
+    """
+
+    def __init__(self, bounds, keys=None):
+        self.bounds = np.asarray(bounds, dtype="float64")
+        self.keys = None if keys is None else np.asarray(keys, dtype=str)
+        self.tree = shapely.STRtree(shapely.box(*self.bounds.T))
+        self.prefixes = None if self.keys is None else PrefixIndex(self.keys)
+
+    def __len__(self):
+        return len(self.bounds)
+
+    @property
+    def nbytes(self):
+        """
+        Estimated memory of the index in bytes
+        """
+        nbytes = self.bounds.nbytes + TREE_BYTES * len(self)
+        if self.keys is not None:
+            nbytes += self.keys.nbytes + self.prefixes.order.nbytes
+        return nbytes
+
+    @classmethod
+    def build(cls, gdf, key_column=None):
+        keys = None if key_column is None else gdf[key_column].to_numpy()
+        return cls(shapely.bounds(gdf.geometry.to_numpy()), keys)
+
+    def save(self, path, version=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        arrays = {"bounds": self.bounds, "version": np.asarray(str(version))}
+        if self.keys is not None:
+            arrays["keys"] = self.keys
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path, version=None):
+        """
+        Load a saved index, or return None if it is missing or was saved for
+        another version of the data
+        """
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if str(data["version"]) != str(version):
+                return None
+            keys = data["keys"] if "keys" in data else None
+            return cls(data["bounds"], keys)
+
+    def query(self, bbox):
+        """
+        Sorted positions of the features whose bounds intersect bbox
+        """
+        return np.sort(self.tree.query(shapely.box(*bbox)))
+
+    def prefix(self, *prefixes):
+        """
+        Sorted positions of the features whose key starts with any prefix
+        """
+        if self.prefixes is None:
+            raise ValueError("index has no key column")
+        return np.unique(np.concatenate([self.prefixes.lookup(p) for p in prefixes]))
+
+
+def source_version(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def build_index(name, gdf, key_column=None, source=None):
+    """
+    Build the index of a layer. When the layer's source file is given, the index
+    is persisted under INDEX_DIR and loaded from there until the source changes.
+    """
+    index = None
+    if source is not None:
+        path = os.path.join(INDEX_DIR, f"{name}.npz")
+        version = source_version(source)
+        index = SpatialIndex.load(path, version)
+    if index is None or len(index) != len(gdf):
+        index = SpatialIndex.build(gdf, key_column)
+        if source is not None:
+            index.save(path, version)
+    return index
+
+
+def get_index(name, gdf, key_column=None, source=None):
+    """
+    The index of a layer, built by build_index and kept in a bounded cache, so
+    an evicted index is built (or loaded) again on its next use
+    """
+    index = _indexes.get(name)
+    if index is None:
+        index = build_index(name, gdf, key_column, source)
+        _indexes.set(name, index, nbytes=index.nbytes)
+    return index
+
+
+def benchmark(gdf, key_column=None, queries=200, seed=0):
+    """
+    Time index builds and random viewport queries at zoom 4-10, reporting the
+    mean latency and the fraction of features each query returns
+    """
+    from .lod import viewport_bbox
+
+    start = time.perf_counter()
+    index = SpatialIndex.build(gdf, key_column)
+    result = {"features": len(index), "build_ms": (time.perf_counter() - start) * 1e3}
+
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = shapely.total_bounds(gdf.geometry.to_numpy())
+    for zoom in (4, 6, 8, 10):
+        bboxes = [
+            viewport_bbox(rng.uniform(minx, maxx), rng.uniform(miny, maxy), zoom)
+            for _ in range(queries)
+        ]
+        start = time.perf_counter()
+        counts = [len(index.query(bbox)) for bbox in bboxes]
+        seconds = time.perf_counter() - start
+        result[f"zoom_{zoom}"] = {
+            "query_ms": seconds / queries * 1e3,
+            "fraction_sent": float(np.mean(counts)) / max(len(index), 1),
+        }
+
+    if key_column is not None:
+        prefixes = sorted({str(key)[:2] for key in index.keys})
+        start = time.perf_counter()
+        counts = [len(index.prefix(p)) for p in prefixes]
+        result["prefix_ms"] = (time.perf_counter() - start) / len(prefixes) * 1e3
+        result["prefix_fraction_sent"] = float(np.mean(counts)) / len(index)
+    return result
+
+
+def main(argv=None):
+    import json
+
+    from .upload import read_vector
+    from .zonal import huc_column
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="vector layer to index")
+    parser.add_argument("--benchmark", action="store_true")
+    args = parser.parse_args(argv)
+
+    gdf = read_vector(args.path)
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    try:
+        key_column = huc_column(gdf)
+    except KeyError:
+        key_column = None
+
+    name = os.path.splitext(os.path.basename(args.path))[0]
+    if args.benchmark:
+        print(json.dumps(benchmark(gdf, key_column), indent=4))
+    else:
+        index = build_index(name, gdf, key_column, source=args.path)
+        print(f"{len(index)} features indexed to {INDEX_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,23 @@
 import ee
 import geemap.foliumap as geemap
 import geemap.colormaps as cm
-import geopandas as gpd
+import pandas as pd
 import streamlit as st
-
-
-@st.cache
-def uploaded_file_to_gdf(data):
-    import tempfile
-    import os
-    import uuid
-
-    _, file_extension = os.path.splitext(data.name)
-    file_id = str(uuid.uuid4())
-    file_path = os.path.join(tempfile.gettempdir(), f"{file_id}{file_extension}")
-
-    with open(file_path, "wb") as file:
-        file.write(data.getbuffer())
-
-    if file_path.lower().endswith(".kml"):
-        gpd.io.file.fiona.drvsupport.supported_drivers["KML"] = "rw"
-        gdf = gpd.read_file(file_path, driver="KML")
-    else:
-        gdf = gpd.read_file(file_path)
-
-    return gdf
+from .agreement import cached_agreement, mask_path, roi_geometries
+from .catalog import COUNTRIES, layer_names, legend_dict
+from .countries import load_countries
+from .data_dict import LOCAL_COG, backends, ee_available, local_tile_layer
+from .map_state import MapState
+from .roi import upload_to_roi
+from .tracing import span
+
+# Land cover basemaps backed by a data_dict registry entry, which can also be
+# served from a local COG, and their builtin legends.
+REGISTRY_BASEMAPS = {
+    "ESA Global Land Cover 2020": ("ESA WorldCover", "ESA_WorldCover"),
+    "ESRI Global Land Cover 2020": ("ESRI Global Land Cover", "ESRI_LandCover"),
+    "US NLCD 2019": ("NLCD 2019", "NLCD"),
+}
 
 
 def app():
@@ -43,12 +36,27 @@ def app():
 
     col1, col2 = st.columns([3, 1])
 
-    Map = geemap.Map(Draw_export=False, locate_control=True, plugin_LatLngPopup=True)
-
-    roi = ee.FeatureCollection("users/giswqs/public/countries")
-    # countries = roi.aggregate_array("name").getInfo()
-    # countries.sort()
-    countries = ["United States of America"]
+    Map = geemap.Map(
+        Draw_export=False,
+        locate_control=True,
+        plugin_LatLngPopup=True,
+        ee_initialize=False,
+    )
+    state = MapState("split")
+
+    use_ee = ee_available()
+    if use_ee:
+        roi = ee.FeatureCollection(COUNTRIES)
+    else:
+        st.warning("Earth Engine is unavailable, showing local layers only")
+        roi = None
+    # Country names come from the local index written by `python -m apps.countries`;
+    # without it, listing them would cost an Earth Engine request per rerun.
+    country_index = load_countries()
+    if country_index is not None:
+        countries = country_index.names
+    else:
+        countries = ["United States of America"]
 
     lc_basemaps = [
         "ESA Global Land Cover 2020",
@@ -61,25 +69,39 @@ def app():
     google_basemaps = ["OpenStreetMap"] + [
         "Google " + b for b in list(geemap.basemaps.keys())[1:5]
     ]
+    if not use_ee:
+        # Only the land cover basemaps with a local COG can be shown.
+        lc_basemaps = [
+            basemap
+            for basemap in lc_basemaps
+            if basemap in REGISTRY_BASEMAPS and backends(REGISTRY_BASEMAPS[basemap][0])
+        ]
     basemaps = google_basemaps + lc_basemaps
 
     with col2:
 
-        latitude = st.number_input("Map center latitude", -90.0, 90.0, 40.0, step=0.5)
-        longitude = st.number_input(
-            "Map center longitude", -180.0, 180.0, -100.0, step=0.5
-        )
-        zoom = st.slider("Map zoom level", 1, 22, 4)
+        latitude, longitude, zoom = state.view_inputs()
 
+        gdf = None
         select = st.checkbox("Select a country")
         if select:
             country = st.selectbox(
                 "Select a country from dropdown list",
                 countries,
-                index=countries.index("United States of America"),
+                index=(
+                    countries.index("United States of America")
+                    if "United States of America" in countries
+                    else 0
+                ),
+            )
+            st.session_state["ROI"] = (
+                roi.filter(ee.Filter.eq("name", country)) if use_ee else None
             )
-            st.session_state["ROI"] = roi.filter(ee.Filter.eq("name", country))
+            if country_index is not None and country in country_index:
+                state.select(country, lambda: country_index.view(country))
+                gdf = country_index.geometry(country)
         else:
+            state.select(None)
 
             with st.expander("Click here to upload an ROI", False):
                 upload = st.file_uploader(
@@ -87,9 +109,18 @@ def app():
                     type=["geojson", "kml", "zip"],
                 )
 
-                if upload:
-                    gdf = uploaded_file_to_gdf(upload)
-                    st.session_state["ROI"] = geemap.gdf_to_ee(gdf, geodesic=False)
+                if upload and not use_ee:
+                    st.info("Uploaded ROIs need Earth Engine")
+                    st.session_state["ROI"] = roi
+                elif upload:
+                    gdf, st.session_state["ROI"], stats = upload_to_roi(upload)
+                    removed = stats["vertices_before"] - stats["vertices_after"]
+                    saved = stats["bytes_before"] - stats["bytes_after"]
+                    if removed:
+                        st.caption(
+                            f"ROI simplified: {removed:,} vertices removed, "
+                            f"{saved:,} bytes saved"
+                        )
                     # Map.add_gdf(gdf, "ROI")
                 else:
                     st.session_state["ROI"] = roi
@@ -103,19 +134,32 @@ def app():
             Map.add_basemap(basemap.replace("Google ", ""))
         elif basemap in lc_basemaps:
 
-            if basemap == "ESA Global Land Cover 2020":
+            backend = None
+            if basemap in REGISTRY_BASEMAPS:
+                registry_name, legend = REGISTRY_BASEMAPS[basemap]
+                backend = st.selectbox(
+                    "Select the basemap backend", backends(registry_name)
+                )
+
+            if backend == LOCAL_COG:
+                layer = state.memo(
+                    ("cog", registry_name), lambda: local_tile_layer(registry_name)
+                )
+                layer.add_to(Map)
+                Map.add_legend(title=basemap, builtin_legend=legend)
+            elif basemap == "ESA Global Land Cover 2020":
                 dataset = ee.ImageCollection("ESA/WorldCover/v100").first()
                 if st.session_state["ROI"] is not None:
                     dataset = dataset.clipToCollection(st.session_state["ROI"])
 
-                Map.addLayer(dataset, {}, "ESA Landcover")
+                state.add_layer(Map, dataset, {}, "ESA Landcover")
                 Map.add_legend(title="ESA Landcover", builtin_legend="ESA_WorldCover")
             elif basemap == "ESRI Global Land Cover 2020":
 
                 esri_lulc10 = ee.ImageCollection(
                     "projects/sat-io/open-datasets/landcover/ESRI_Global-LULC_10m"
                 )
-                legend_dict = {
+                esri_legend = {
                     "names": [
                         "Water",
                         "Trees",
@@ -142,12 +186,12 @@ def app():
                     ],
                 }
 
-                vis_params = {"min": 1, "max": 10, "palette": legend_dict["colors"]}
+                vis_params = {"min": 1, "max": 10, "palette": esri_legend["colors"]}
                 esri_lulc10 = esri_lulc10.mosaic()
 
                 if st.session_state["ROI"] is not None:
                     esri_lulc10 = esri_lulc10.clipToCollection(st.session_state["ROI"])
-                Map.addLayer(esri_lulc10, vis_params, "ESRI Global Land Cover")
+                state.add_layer(Map, esri_lulc10, vis_params, "ESRI Global Land Cover")
                 Map.add_legend(title="ESRI Landcover", builtin_legend="ESRI_LandCover")
 
             elif basemap == "US NLCD 2019":
@@ -156,7 +200,7 @@ def app():
                 )
                 if st.session_state["ROI"] is not None:
                     nlcd = nlcd.clipToCollection(st.session_state["ROI"])
-                Map.addLayer(nlcd, {}, "US NLCD 2019")
+                state.add_layer(Map, nlcd, {}, "US NLCD 2019")
                 Map.add_legend(title="NLCD Land Cover", builtin_legend="NLCD")
 
             elif basemap == "USDA NASS Cropland 2020":
@@ -170,7 +214,7 @@ def app():
                 if st.session_state["ROI"] is not None:
                     cropland = cropland.clipToCollection(st.session_state["ROI"])
 
-                Map.addLayer(cropland, {}, "USDA NASS Cropland 2020")
+                state.add_layer(Map, cropland, {}, "USDA NASS Cropland 2020")
 
     # roi = ee.FeatureCollection("users/giswqs/MRB/NWI_HU8_Boundary_Simplify")
     style = {
@@ -182,110 +226,36 @@ def app():
 
     # select_holder = col2.empty()
     with col2:
-        layers = [
-            "ESA Land Use",
-            "JRC Max Water Extent",
-            "OpenStreetMap",
-            "HydroLakes",
-            "LAGOS",
-            "US NED Depressions",
-            "Global River Width",
-        ]
-
-        width = 1
-        styles = {
-            "ESA Land Use": {
-                "color": "000000ff",
-                "width": width,
-                "fillColor": "dca0dcff",
-            },
-            "JRC Max Water Extent": {
-                "color": "000000ff",
-                "width": width,
-                "fillColor": "ffc2cbff",
-            },
-            "OpenStreetMap": {
-                "color": "000000ff",
-                "width": width,
-                "fillColor": "bf03bfff",
-            },
-            "HydroLakes": {
-                "color": "000000ff",
-                "width": width,
-                "fillColor": "4e0583ff",
-            },
-            "LAGOS": {
-                "color": "000000ff",
-                "width": width,
-                "fillColor": "8f228fff",
-            },
-            "US NED Depressions": {
-                "color": "000000ff",
-                "width": width,
-                "fillColor": "8d32e2ff",
-            },
-            "Global River Width": {
-                "color": "000000ff",
-                "width": width,
-                "fillColor": "0000ffff",
-            },
-        }
+        layers = layer_names("surface_water")
 
         left_name = st.selectbox("Select a layer on the left", layers)
         right_name = st.selectbox("Select a layer on the right", layers, index=1)
-
-        def get_layer(name):
-            if name == "ESA Land Use":
-                dataset = ee.FeatureCollection("users/giswqs/MRB/ESA_entireUS")
-                return geemap.ee_tile_layer(
-                    dataset.style(**styles["ESA Land Use"]), {}, "ESA Land Use"
-                )
-
-            elif name == "JRC Max Water Extent":
-                dataset = ee.FeatureCollection("users/giswqs/MRB/JRC_entireUS")
-                return geemap.ee_tile_layer(
-                    dataset.style(**styles["JRC Max Water Extent"]),
-                    {},
-                    "JRC Max Water Extent",
-                )
-
-            elif name == "OpenStreetMap":
-                dataset = ee.FeatureCollection("users/giswqs/MRB/OSM_entireUS")
-                return geemap.ee_tile_layer(
-                    dataset.style(**styles["OpenStreetMap"]), {}, "OpenStreetMap"
-                )
-
-            elif name == "HydroLakes":
-                dataset = ee.FeatureCollection("users/giswqs/MRB/HL_entireUS")
-                return geemap.ee_tile_layer(
-                    dataset.style(**styles["HydroLakes"]), {}, "HydroLakes"
-                )
-
-            elif name == "LAGOS":
-                dataset = ee.FeatureCollection("users/giswqs/MRB/LAGOS_entireUS")
-                return geemap.ee_tile_layer(
-                    dataset.style(**styles["LAGOS"]), {}, "LAGOS"
-                )
-
-            elif name == "US NED Depressions":
-                depressions = ee.FeatureCollection("users/giswqs/MRB/US_depressions")
-                return geemap.ee_tile_layer(
-                    depressions.style(**styles["US NED Depressions"]),
-                    {},
-                    "US NED Depressions",
-                )
+        analyze = st.checkbox("Agreement analysis")
 
         if left_name == right_name:
             st.error("Please select different layers")
-        left_layer = get_layer(left_name)
-        right_layer = get_layer(right_name)
-
-        legend_dict = {}
-        legend_dict[left_name] = styles[left_name]["fillColor"][:6]
-        legend_dict[right_name] = styles[right_name]["fillColor"][:6]
-        Map.add_legend(title="Surface Water", legend_dict=legend_dict)
+        pending = state.submit_tile_layers(
+            [left_name, right_name], st.session_state["ROI"]
+        )
+        split_layers = []
+        for layer_name, future in pending:
+            if future.exception() is not None:
+                st.error(f"Failed to load {layer_name}: {future.exception()}")
+            else:
+                split_layers.append(future.result()[0])
+
+        with span("legend"):
+            Map.add_legend(
+                title="Surface Water",
+                legend_dict=legend_dict([left_name, right_name]),
+            )
 
-        Map.split_map(left_layer, right_layer)
+        if len(split_layers) == 2:
+            Map.split_map(*split_layers)
+        else:
+            # Show the side that loaded on its own.
+            for layer in split_layers:
+                layer.add_to(Map)
 
     #     datasets = st.multiselect(
     #         "Select surface water datasets",
@@ -547,12 +517,50 @@ def app():
     else:
         name = "World"
 
-    Map.addLayer(st.session_state["ROI"].style(**style), {}, name, show)
+    if st.session_state["ROI"] is not None:
+        state.add_layer(Map, st.session_state["ROI"].style(**style), {}, name, show)
     # Map.centerObject(st.session_state["ROI"])
     Map.set_center(longitude, latitude, zoom)
 
     with col1:
-        Map.to_streamlit(height=680)
+        state.render(
+            Map, height=680, basemap=basemap, center=(latitude, longitude, zoom)
+        )
+
+        if analyze:
+            left_path, right_path = mask_path(left_name), mask_path(right_name)
+            if left_path is None or right_path is None:
+                st.info(
+                    "Agreement analysis needs local water masks of both layers, "
+                    'e.g. python -m apps.cog "NAME=PATH" --water-min 1'
+                )
+            else:
+                geometries = None
+                if gdf is not None:
+                    geometries = roi_geometries(gdf, left_path)
+                elif select:
+                    st.caption(
+                        "No local country index (python -m apps.countries), "
+                        "using full extent"
+                    )
+                try:
+                    with st.spinner("Computing agreement..."):
+                        result = cached_agreement(left_path, right_path, geometries)
+                except ValueError as e:
+                    st.warning(str(e))
+                else:
+                    st.table(
+                        pd.DataFrame(
+                            result["confusion_km2"],
+                            index=[f"{left_name}: land", f"{left_name}: water"],
+                            columns=[f"{right_name}: land", f"{right_name}: water"],
+                        )
+                    )
+                    st.write(
+                        f"IoU: {result['iou']:.3f}, kappa: {result['kappa']:.3f}, "
+                        f"omission: {result['omission_km2']:,.1f} km², "
+                        f"commission: {result['commission_km2']:,.1f} km²"
+                    )
 
     with col2:
         with st.expander("Data Sources"):
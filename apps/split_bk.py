@@ -5,7 +5,23 @@ import pandas as pd
 import streamlit as st
 import geemap.foliumap as geemap
 import folium.plugins as plugins
-from .data_dict import DEMS, LANDCOVERS, LANDFORMS
+from . import vector_tiles
+from .cache import tile_key
+from .catalog import get_entry, local_path, read_local
+from .data_dict import (
+    DEMS,
+    LANDCOVERS,
+    LANDFORMS,
+    LOCAL_COG,
+    backends,
+    derived_image,
+    ee_available,
+    local_tile_layer,
+    vis_params,
+)
+from .map_state import MapState
+from .spatial_index import get_index
+from .zonal import huc_column
 
 
 def app():
@@ -30,6 +46,11 @@ def app():
             names,
             index=names.index("TERRAIN"),
         )
+        if left_name not in basemaps:
+            left_backend = st.selectbox("Select the left backend", backends(left_name))
+            if left_backend is None:
+                st.error(f"{left_name} is unavailable offline")
+                st.stop()
 
     with col1a:
         left_palette = st.selectbox(
@@ -44,6 +65,13 @@ def app():
             names,
             index=names.index("HYBRID"),
         )
+        if right_name not in basemaps:
+            right_backend = st.selectbox(
+                "Select the right backend", backends(right_name)
+            )
+            if right_backend is None:
+                st.error(f"{right_name} is unavailable offline")
+                st.stop()
     with col2a:
         right_palette = st.selectbox(
             "Select the right colormap",
@@ -73,80 +101,112 @@ def app():
         draw_control=False,
         measure_control=False,
         google_map=False,
+        ee_initialize=False,
     )
+    state = MapState("split_bk")
     Map.add_basemap("HYBRID")
     Map.add_basemap("TERRAIN")
     measure = plugins.MeasureControl(position="bottomleft", active_color="orange")
     measure.add_to(Map)
 
-    st.session_state["ROI"] = ee.FeatureCollection(
-        "users/giswqs/MRB/NWI_HU8_Boundary_Simplify"
-    )
+    use_ee = ee_available()
+    if use_ee:
+        st.session_state["ROI"] = ee.FeatureCollection(
+            "users/giswqs/MRB/NWI_HU8_Boundary_Simplify"
+        )
+    else:
+        st.warning("Earth Engine is unavailable, showing local layers only")
 
     if left_name in basemaps:
         left_layer = basemaps[left_name]
     else:
-        if left_name in DEMS:
-            data = DEMS[left_name]
-        elif left_name in LANDCOVERS:
-            data = LANDCOVERS[left_name]
-        elif left_name in LANDFORMS:
-            data = LANDFORMS[left_name]
-
-        if clip:
-            data["id"] = data["id"].clip(st.session_state["ROI"])
-        if left_palette != "Default":
-            if left_name in DEMS:
-                data["vis"]["palette"] = cm.get_palette(left_palette, 15)
-        left_layer = geemap.ee_tile_layer(data["id"], data["vis"], left_name)
+        palette = None
+        if left_palette != "Default" and left_name in DEMS:
+            palette = cm.get_palette(left_palette, 15)
+        vis = vis_params(left_name, palette)
+
+        if left_backend == LOCAL_COG:
+            left_layer = state.memo(
+                ("cog", tile_key(left_name, vis_params=vis)),
+                lambda: local_tile_layer(left_name, vis),
+            )
+        else:
+            roi = st.session_state["ROI"] if clip else None
+            image = derived_image(left_name, roi)
+            left_layer = state.tile_layer(image, vis, left_name)
 
     if right_name in basemaps:
         right_layer = basemaps[right_name]
     else:
-        if right_name in DEMS:
-            data = DEMS[right_name]
-        elif right_name in LANDCOVERS:
-            data = LANDCOVERS[right_name]
-        elif right_name in LANDFORMS:
-            data = LANDFORMS[right_name]
-
-        if clip:
-            data["id"] = data["id"].clip(st.session_state["ROI"])
-
-        if right_palette != "Default":
-            if right_name in DEMS:
-                data["vis"]["palette"] = cm.get_palette(right_palette, 15)
-        right_layer = geemap.ee_tile_layer(data["id"], data["vis"], right_name)
+        palette = None
+        if right_palette != "Default" and right_name in DEMS:
+            palette = cm.get_palette(right_palette, 15)
+        vis = vis_params(right_name, palette)
+
+        if right_backend == LOCAL_COG:
+            right_layer = state.memo(
+                ("cog", tile_key(right_name, vis_params=vis)),
+                lambda: local_tile_layer(right_name, vis),
+            )
+        else:
+            roi = st.session_state["ROI"] if clip else None
+            image = derived_image(right_name, roi)
+            right_layer = state.tile_layer(image, vis, right_name)
 
     if left_name == right_name:
         st.error("Please select different layers")
     Map.split_map(left_layer, right_layer)
 
-    sinks_30m = ee.FeatureCollection("users/giswqs/MRB/NED_30m_sinks")
-
-    Map.addLayer(sinks_30m, {}, "Depressions (30m)", False)
+    if use_ee:
+        sinks_30m = ee.FeatureCollection("users/giswqs/MRB/NED_30m_sinks")
 
-    sinks_10m = ee.FeatureCollection("users/giswqs/MRB/NED_10m_sinks")
-    sinks_10m_style = sinks_10m.style(
-        **{"color": "0000ff", "width": 2, "fillColor": "0000ff44"}
-    )
-    Map.addLayer(sinks_10m_style, {}, "Depressions (10m)", False)
+        state.add_layer(Map, sinks_30m, {}, "Depressions (30m)", False)
 
-    huc8 = ee.FeatureCollection("USGS/WBD/2017/HUC10").filter(
-        ee.Filter.Or(
-            ee.Filter.stringStartsWith(**{"leftField": "huc10", "rightValue": "05"}),
-            ee.Filter.stringStartsWith(**{"leftField": "huc10", "rightValue": "07"}),
-            ee.Filter.stringStartsWith(**{"leftField": "huc10", "rightValue": "10"}),
+        sinks_10m = ee.FeatureCollection("users/giswqs/MRB/NED_10m_sinks")
+        sinks_10m_style = sinks_10m.style(
+            **{"color": "0000ff", "width": 2, "fillColor": "0000ff44"}
         )
-    )
-    Map.addLayer(
-        huc8.style(**{"fillColor": "00000000", "width": 1}), {}, "NHD-HUC10", False
-    )
-
-    ROI_style = st.session_state["ROI"].style(
-        **{"color": "ff0000", "width": 2, "fillColor": "00000000"}
-    )
-    Map.addLayer(ROI_style, {}, "Study Area")
+        state.add_layer(Map, sinks_10m_style, {}, "Depressions (10m)", False)
+
+        huc_path = local_path(get_entry("NHD-HUC10", "watersheds")["layers"][0])
+        if huc_path is not None and vector_tiles.available():
+            # Subset the local HUC10 boundaries through the prefix index.
+            hucs = read_local(huc_path)
+            index = get_index("HUC10", hucs, huc_column(hucs), source=huc_path)
+            hucs = hucs.iloc[index.prefix("05", "07", "10")]
+            layer = state.memo(
+                ("huc10", "05", "07", "10"),
+                lambda: vector_tiles.folium_layer(
+                    "HUC10_05_07_10", hucs, "#000000", "NHD-HUC10"
+                ),
+            )
+            layer.add_to(Map)
+        else:
+            huc8 = ee.FeatureCollection("USGS/WBD/2017/HUC10").filter(
+                ee.Filter.Or(
+                    ee.Filter.stringStartsWith(
+                        **{"leftField": "huc10", "rightValue": "05"}
+                    ),
+                    ee.Filter.stringStartsWith(
+                        **{"leftField": "huc10", "rightValue": "07"}
+                    ),
+                    ee.Filter.stringStartsWith(
+                        **{"leftField": "huc10", "rightValue": "10"}
+                    ),
+                )
+            )
+            state.add_layer(
+                Map,
+                huc8.style(**{"fillColor": "00000000", "width": 1}),
+                {},
+                "NHD-HUC10",
+                False,
+            )
+
+        ROI_style = st.session_state["ROI"].style(
+            **{"color": "ff0000", "width": 2, "fillColor": "00000000"}
+        )
+        state.add_layer(Map, ROI_style, {}, "Study Area")
 
     if left_name in LANDFORMS or right_name in LANDFORMS:
         Map.add_legend(title="ALOS Landforms", builtin_legend="ALOS_landforms")
@@ -160,4 +220,10 @@ def app():
     if left_name == "NLCD 2019" or right_name == "NLCD 2019":
         Map.add_legend(title="NLCD Landcover", builtin_legend="NLCD")
 
-    Map.to_streamlit(height=600)
+    state.render(
+        Map,
+        height=600,
+        center=(lat, lon, zoom),
+        left=left_name,
+        right=right_name,
+    )
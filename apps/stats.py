@@ -0,0 +1,118 @@
+import math
+
+import ee
+import pandas as pd
+from .cache import fingerprint, make_cache
+from .catalog import get_entry, layer_names
+from .data_dict import get_image
+from .tracing import span
+
+# Land cover classes counted as water, by data_dict registry name.
+LANDCOVER_WATER = {
+    "NLCD 2019": [11],
+    "ESRI Global Land Cover": [1],
+}
+ROI_AREA = "ROI"
+# Resolutions in m for water area statistics, finest first, and the most pixels
+# one reduction may cover before a coarser resolution is used.
+SCALES = (30, 60, 120, 250, 500, 1000, 2000, 5000, 10000)
+MAX_PIXELS = 1e8
+EARTH_RADIUS = 6371008.8
+
+stats_cache = make_cache("stats", maxsize=128, ttl=24 * 3600)
+
+
+def water_mask(name):
+    """
+    A 0/1 ee.Image of the water in a catalog entry or land cover dataset.
+    Vector entries are rasterized; raster entries count any positive pixel.
+    """
+    if name in LANDCOVER_WATER:
+        image = get_image(name)
+        return image.remap(LANDCOVER_WATER[name], [1] * len(LANDCOVER_WATER[name]), 0)
+
+    spec = get_entry(name)["layers"][0]
+    if spec["type"] == "FeatureCollection":
+        return ee.Image(0).byte().paint(ee.FeatureCollection(spec["asset"]), 1)
+    if spec["type"] == "ImageCollection":
+        image = getattr(ee.ImageCollection(spec["asset"]), spec["reducer"])()
+    else:
+        image = ee.Image(spec["asset"])
+    return image.select(0).gt(0).unmask(0)
+
+
+def dataset_names():
+    return layer_names("surface_water") + list(LANDCOVER_WATER)
+
+
+def area_image(names):
+    """
+    One image with a band of water area in km² per dataset, plus the ROI area,
+    so a single reduction covers every dataset. Bands are named b0, b1, ...
+    """
+    bands = [ee.Image(1).rename(ROI_AREA)]
+    bands += [water_mask(name).rename(f"b{i}") for i, name in enumerate(names)]
+    return ee.Image.cat(bands).multiply(ee.Image.pixelArea()).divide(1e6)
+
+
+def bbox_area(bbox):
+    """
+    Area in m² of a (minx, miny, maxx, maxy) box in degrees on a spherical Earth
+    """
+    minx, miny, maxx, maxy = bbox
+    return (
+        EARTH_RADIUS**2
+        * math.radians(maxx - minx)
+        * (math.sin(math.radians(maxy)) - math.sin(math.radians(miny)))
+    )
+
+
+def roi_scale(area, max_pixels=MAX_PIXELS):
+    """
+    Finest of SCALES at which an ROI of `area` m² covers at most max_pixels pixels
+    """
+    for scale in SCALES:
+        if area / scale**2 <= max_pixels:
+            return scale
+    return SCALES[-1]
+
+
+def reduce_region(image, roi, scale):
+    """
+    Sum every band of an image over the ROI in one Earth Engine request
+    """
+    return image.reduceRegion(
+        reducer=ee.Reducer.sum(),
+        geometry=roi.geometry(),
+        scale=scale,
+        maxPixels=1e13,
+        bestEffort=True,
+        tileScale=4,
+    ).getInfo()
+
+
+def water_area(roi, names=None, scale=30, reduce=reduce_region):
+    """
+    Water area per dataset over an ROI as a DataFrame with one row per dataset.
+    `reduce(image, roi, scale)` returns the band sums. The image is still built
+    with the Earth Engine client, which must be initialized; only the reduction
+    can be replaced, e.g. by a local stand-in in tests. Results are cached by
+    ROI hash.
+    """
+    names = list(names or dataset_names())
+    key = (fingerprint(roi), tuple(names), scale)
+    df = stats_cache.get(key)
+    if df is None:
+        with span("reduceRegion"):
+            sums = reduce(area_image(names), roi, scale)
+        roi_area = sums.get(ROI_AREA) or 0
+        rows = []
+        for i, name in enumerate(names):
+            area = sums.get(f"b{i}") or 0
+            percent = 100 * area / roi_area if roi_area else 0
+            rows.append(
+                {"Dataset": name, "Water area (km²)": area, "% of ROI": percent}
+            )
+        df = pd.DataFrame(rows)
+        stats_cache.set(key, df)
+    return df
@@ -0,0 +1,213 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future
+
+from . import tile_server
+
+# Set GSWIS_TILE_CACHE to an .mbtiles path to route Earth Engine tiles through
+# the local caching proxy. Upstream URLs are kept in the same file, so with several
+# workers whichever one serves the tile server's port can resolve every layer.
+TILE_CACHE_PATH = os.environ.get("GSWIS_TILE_CACHE")
+MAX_BYTES = 1024 * 1024 * 1024
+MAX_AGE = 30 * 24 * 3600
+
+
+class TileStore:
+    """
+    An MBTiles-style SQLite store of tiles keyed by (layer, z, x, y), evicted by
+    total size and age, and of the upstream URL template of each layer
+    """
+
+    def __init__(self, path, max_bytes=MAX_BYTES, max_age=MAX_AGE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS tiles (
+                layer TEXT,
+                zoom_level INTEGER,
+                tile_column INTEGER,
+                tile_row INTEGER,
+                tile_data BLOB,
+                fetched_at REAL,
+                PRIMARY KEY (layer, zoom_level, tile_column, tile_row)
+            )""")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS tiles_fetched_at ON tiles (fetched_at)"
+        )
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS upstreams (
+                layer TEXT PRIMARY KEY,
+                url TEXT,
+                registered_at REAL
+            )""")
+        self._conn.commit()
+
+    def get_upstream(self, layer):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url FROM upstreams WHERE layer=?", (layer,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def set_upstream(self, layer, url):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO upstreams VALUES (?, ?, ?)",
+                (layer, url, time.time()),
+            )
+            self._conn.commit()
+
+    def get(self, layer, z, x, y):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tile_data, fetched_at FROM tiles WHERE layer=? AND "
+                "zoom_level=? AND tile_column=? AND tile_row=?",
+                (layer, z, x, y),
+            ).fetchone()
+        if row is None or row[1] < time.time() - self.max_age:
+            return None
+        return row[0]
+
+    def __contains__(self, key):
+        return self.get(*key) is not None
+
+    def put(self, layer, z, x, y, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?)",
+                (layer, z, x, y, sqlite3.Binary(data), time.time()),
+            )
+            self._conn.commit()
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict()
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(tile_data)), 0) FROM tiles"
+            ).fetchone()[0]
+
+    def evict(self):
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        self._conn.execute(
+            "DELETE FROM tiles WHERE fetched_at < ?", (time.time() - self.max_age,)
+        )
+        self._conn.execute(
+            "DELETE FROM upstreams WHERE registered_at < ?",
+            (time.time() - self.max_age,),
+        )
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(tile_data)), 0) FROM tiles"
+        ).fetchone()[0]
+        while total > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT rowid, LENGTH(tile_data) FROM tiles "
+                "ORDER BY fetched_at LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            self._conn.executemany(
+                "DELETE FROM tiles WHERE rowid=?", [(rowid,) for rowid, _ in rows]
+            )
+            total -= sum(size for _, size in rows)
+        self._conn.commit()
+
+
+_store = None
+_store_lock = threading.Lock()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+
+    with _store_lock:
+        if _store is None and TILE_CACHE_PATH:
+            _store = TileStore(TILE_CACHE_PATH)
+    return _store
+
+
+def enabled():
+    """
+    Whether Earth Engine tiles go through the proxy: a tile store is configured
+    and the tile server is reachable
+    """
+    return get_store() is not None and tile_server.reachable()
+
+
+def fetch_url(url, timeout=30):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+
+def get_tile(layer, z, x, y):
+    """
+    Return a tile from the store, fetching it from the upstream URL on a miss.
+    Concurrent requests for the same missing tile share one upstream fetch.
+    """
+    store = get_store()
+    tile = store.get(layer, z, x, y)
+    if tile is not None:
+        return tile
+
+    key = (layer, z, x, y)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+
+    if not owner:
+        return future.result()
+
+    try:
+        tile = fetch_url(store.get_upstream(layer).format(z=z, x=x, y=y))
+        store.put(layer, z, x, y, tile)
+        future.set_result(tile)
+        return tile
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+
+def _handle(parts):
+    layer, z, x, y = parts[0], int(parts[1]), int(parts[2]), int(parts[3].split(".")[0])
+    store = get_store()
+    if store is None or store.get_upstream(layer) is None:
+        return 404, "text/plain", b"Unknown layer"
+    return 200, "image/png", get_tile(layer, z, x, y)
+
+
+tile_server.register_route("tiles", _handle)
+
+
+def layer_fingerprint(key):
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+
+def proxied_url(key, url):
+    """
+    Register an upstream tile URL template under a layer key and return the local
+    proxy URL. The key identifies the layer content (asset, style, vis, ROI), so
+    cached tiles survive a re-minted map ID.
+    """
+    layer = layer_fingerprint(key)
+    store = get_store()
+    if store.get_upstream(layer) != url:
+        store.set_upstream(layer, url)
+    return f"{tile_server.base_url()}/tiles/{layer}/{{z}}/{{x}}/{{y}}"
@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Address the tile server binds. The default random port only works for a browser
+# on the same host; set a fixed port (and GSWIS_TILE_SERVER_URL, the address the
+# browser uses) to put the server behind a reverse proxy. Layers the browser
+# fetches from it are only offered once that URL is set, or GSWIS_LOCAL_TILES=1
+# declares that the browser runs on this host.
+HOST = os.environ.get("GSWIS_TILE_SERVER_HOST", "127.0.0.1")
+PORT = int(os.environ.get("GSWIS_TILE_SERVER_PORT", "0"))
+# Seconds a reachability check is reused.
+CHECK_INTERVAL = 60
+
+# Handlers keyed by the first path segment. Each takes the remaining path
+# segments and returns (status, content_type, body).
+_routes = {}
+_server = None
+_lock = threading.Lock()
+_bind_error = None
+_reachable = {}
+
+
+def register_route(prefix, handler):
+    _routes[prefix] = handler
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        handler = _routes.get(parts[0])
+        if handler is None:
+            status, content_type, body = 404, "text/plain", b"Not found"
+        else:
+            try:
+                status, content_type, body = handler(parts[1:])
+            except Exception as e:
+                status, content_type, body = 500, "text/plain", str(e).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(host=None, port=None):
+    """
+    Start the in-process tile server once and return its address. If the port is
+    taken, e.g. by another worker process, the configured address is returned
+    and this process does not serve.
+    """
+    global _server, _bind_error
+
+    host = HOST if host is None else host
+    port = PORT if port is None else port
+    with _lock:
+        if _server is None and _bind_error is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _Handler)
+            except OSError as e:
+                _bind_error = e
+                logger.warning("Tile server not started on %s:%s: %s", host, port, e)
+            else:
+                _server.daemon_threads = True
+                thread = threading.Thread(target=_server.serve_forever, daemon=True)
+                thread.start()
+    if _server is None:
+        return host, port
+    return _server.server_address
+
+
+def serving():
+    """
+    Whether this process runs the tile server, and so can serve the layers it
+    holds in memory
+    """
+    start()
+    return _server is not None
+
+
+def base_url():
+    """
+    URL the browser uses to reach the tile server. Set GSWIS_TILE_SERVER_URL
+    when the app runs behind a proxy.
+    """
+    host, port = start()
+    return os.environ.get("GSWIS_TILE_SERVER_URL", f"http://{host}:{port}").rstrip("/")
+
+
+def configured():
+    """
+    Whether the browser is known to reach base_url(): GSWIS_TILE_SERVER_URL is
+    set, or GSWIS_LOCAL_TILES=1 for a browser on this host
+    """
+    local = os.environ.get("GSWIS_LOCAL_TILES", "").lower() in ("1", "true", "yes")
+    return local or bool(os.environ.get("GSWIS_TILE_SERVER_URL"))
+
+
+def reachable(timeout=2):
+    """
+    Whether the tile server answers at base_url(), checked at most once every
+    CHECK_INTERVAL seconds
+    """
+    url = f"{base_url()}/health"
+    checked = _reachable.get(url)
+    if checked is not None and checked[1] > time.monotonic():
+        return checked[0]
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            ok = response.status == 200
+    except OSError:
+        ok = False
+    if not ok:
+        logger.warning("Tile server unreachable at %s", url)
+    _reachable[url] = ok, time.monotonic() + CHECK_INTERVAL
+    return ok
+
+
+register_route("health", lambda parts: (200, "text/plain", b"ok"))
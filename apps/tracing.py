@@ -0,0 +1,219 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Set GSWIS_TRACE=1 to time the hot paths of each rerun. When unset, span()
+# returns a shared no-op context manager.
+ENABLED = os.environ.get("GSWIS_TRACE", "").lower() in ("1", "true", "yes")
+# Address of the Prometheus /metrics endpoint, started with tracing.
+METRICS_HOST = os.environ.get("GSWIS_METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.environ.get("GSWIS_METRICS_PORT", "9464"))
+
+logger = logging.getLogger(__name__)
+if ENABLED and not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+_NOOP = contextlib.nullcontext()
+_current = contextvars.ContextVar("gswis_trace_rerun", default=None)
+# Process-wide totals per span name: [count, seconds, max seconds].
+_totals = {}
+_lock = threading.Lock()
+_metrics_server = None
+_metrics_lock = threading.Lock()
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+
+
+def span(name):
+    """
+    Time a block under a span name, e.g. `with span("getMapId"): ...`
+    """
+    if not ENABLED:
+        return _NOOP
+    return _Span(name)
+
+
+def record(name, seconds):
+    with _lock:
+        totals = _totals.setdefault(name, [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] = max(totals[2], seconds)
+    spans = _current.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+def propagate(fn):
+    """
+    Wrap a function submitted to a thread pool so its spans count towards the
+    rerun that submitted it
+    """
+    if not ENABLED:
+        return fn
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def summarize(spans):
+    """
+    Aggregate (name, seconds) pairs into {name: [count, seconds]}
+    """
+    summary = {}
+    for name, seconds in spans:
+        entry = summary.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+    return summary
+
+
+@contextlib.contextmanager
+def rerun(page, session_state=None):
+    """
+    Collect the spans of one Streamlit rerun, log them as one JSON line and add
+    them to the session totals in session_state["trace"]
+    """
+    if not ENABLED:
+        yield None
+        return
+
+    spans = []
+    token = _current.set(spans)
+    start = time.perf_counter()
+    try:
+        yield spans
+    finally:
+        total = time.perf_counter() - start
+        _current.reset(token)
+        summary = summarize(spans)
+        logger.info(
+            json.dumps(
+                {
+                    "event": "rerun",
+                    "page": page,
+                    "total_ms": round(total * 1e3, 2),
+                    "spans_ms": {
+                        name: round(seconds * 1e3, 2)
+                        for name, (_, seconds) in summary.items()
+                    },
+                }
+            )
+        )
+        if session_state is not None:
+            trace = session_state.setdefault("trace", {"reruns": 0, "spans": {}})
+            trace["reruns"] += 1
+            trace["last"] = {"page": page, "total": total, "spans": summary}
+            for name, (count, seconds) in summary.items():
+                entry = trace["spans"].setdefault(name, [0, 0.0])
+                entry[0] += count
+                entry[1] += seconds
+
+
+def debug_panel(session_state):
+    """
+    Sidebar expander with the span timings of the last rerun and the session
+    """
+    import pandas as pd
+    import streamlit as st
+
+    trace = session_state.get("trace")
+    if not ENABLED or trace is None:
+        return
+
+    def table(spans):
+        return pd.DataFrame(
+            [
+                {"span": name, "count": count, "ms": round(seconds * 1e3, 1)}
+                for name, (count, seconds) in spans.items()
+            ]
+        )
+
+    with st.sidebar.expander("Debug: timings"):
+        last = trace["last"]
+        st.caption(f"Last rerun ({last['page']}): {last['total'] * 1e3:,.0f} ms")
+        st.dataframe(table(last["spans"]))
+        st.caption(f"Session: {trace['reruns']} reruns")
+        st.dataframe(table(trace["spans"]))
+
+
+def prometheus_text():
+    """
+    Process-wide span totals in the Prometheus text exposition format
+    """
+    with _lock:
+        totals = {name: list(values) for name, values in _totals.items()}
+    lines = [
+        "# HELP gswis_span_seconds Time spent in traced spans",
+        "# TYPE gswis_span_seconds summary",
+    ]
+    for name, (count, seconds, _) in sorted(totals.items()):
+        lines.append(f'gswis_span_seconds_count{{span="{name}"}} {count}')
+        lines.append(f'gswis_span_seconds_sum{{span="{name}"}} {seconds:.6f}')
+    lines += [
+        "# HELP gswis_span_seconds_max Longest single span",
+        "# TYPE gswis_span_seconds_max gauge",
+    ]
+    for name, (_, _, longest) in sorted(totals.items()):
+        lines.append(f'gswis_span_seconds_max{{span="{name}"}} {longest:.6f}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/") == "/metrics":
+            status, content_type = 200, "text/plain; version=0.0.4"
+            body = prometheus_text().encode("utf-8")
+        else:
+            status, content_type, body = 404, "text/plain", b"Not found"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics(host=None, port=None):
+    """
+    Serve /metrics on the configured address once and return the address, or
+    None if it could not be bound, e.g. by a second worker on the same host
+    """
+    global _metrics_server
+
+    host = METRICS_HOST if host is None else host
+    port = METRICS_PORT if port is None else port
+    with _metrics_lock:
+        if _metrics_server is None:
+            try:
+                _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                logger.warning("Metrics not served on %s:%s: %s", host, port, e)
+                return None
+            _metrics_server.daemon_threads = True
+            thread = threading.Thread(target=_metrics_server.serve_forever, daemon=True)
+            thread.start()
+    return _metrics_server.server_address
+
+
+if ENABLED:
+    start_metrics()
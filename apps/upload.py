@@ -1,24 +1,223 @@
+"""
+Upload Vector Data page and the read path behind it: uploads are streamed to
+disk, sniffed and read through pyogrio/Arrow when it is installed.
+
+    python -m apps.upload --benchmark 10000 100000 1000000
+"""
+
+import argparse
+import hashlib
+import json
 import os
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from importlib.util import find_spec
+
 import geopandas as gpd
+import numpy as np
 import streamlit as st
+from .cache import TTLCache
+from . import vector_tiles
+from .lod import build_lods, select_lod, viewport_bbox
+from .spatial_index import get_index
+
+MAX_UPLOAD_BYTES = 500 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+# Read paths compared by the benchmark, fastest first.
+ENGINES = {
+    "pyogrio-arrow": {"engine": "pyogrio", "use_arrow": True},
+    "pyogrio": {"engine": "pyogrio"},
+    "fiona": {"engine": "fiona"},
+}
+
+# Each read runs in a fresh interpreter so its peak memory is its own.
+_READ_SCRIPT = """
+import json, resource, time
+import geopandas as gpd
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+gdf = gpd.read_file({path!r}, **{kwargs!r})
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "features": len(gdf),
+    "seconds": seconds,
+    "baseline_mb": baseline / 1024,
+    "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+"""
 
+# Levels of detail of recently viewed datasets.
+lod_cache = TTLCache(maxsize=8, ttl=None)
 
-def save_uploaded_file(file_content, file_name):
+
+def upload_digest(data):
+    """
+    SHA-256 of the contents of an uploaded file
+    """
+    return hashlib.sha256(data.getbuffer()).hexdigest()
+
+
+def detect_format(head):
     """
-    Save the uploaded file to a temporary directory
+    Detect the vector format of a file from its first bytes
     """
-    import tempfile
-    import os
-    import uuid
+    if head.startswith(b"PK\x03\x04"):
+        return "zip"
+    text = head.lstrip(b"\xef\xbb\xbf").lstrip()
+    if text.startswith(b"{"):
+        return "geojson"
+    if text.startswith(b"<") and b"<kml" in head:
+        return "kml"
+    return None
+
 
+@contextmanager
+def ingest_upload(file_content, file_name, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Stream an uploaded file to a temporary directory in chunks and yield a
+    (path, format) pair that GDAL can open. Zip files are opened through
+    /vsizip/ without extraction. The file is removed on exit.
+    """
     _, file_extension = os.path.splitext(file_name)
-    file_id = str(uuid.uuid4())
-    file_path = os.path.join(tempfile.gettempdir(), f"{file_id}{file_extension}")
 
-    with open(file_path, "wb") as file:
-        file.write(file_content.getbuffer())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, f"upload{file_extension}")
+        size = 0
+        head = b""
+        file_content.seek(0)
+        with open(file_path, "wb") as file:
+            while True:
+                chunk = file_content.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(
+                        f"{file_name} is larger than {max_bytes / 2**20:g} MB"
+                    )
+                if not head:
+                    head = chunk[:1024]
+                file.write(chunk)
+        file_content.seek(0)
+
+        fmt = detect_format(head) or file_extension.lstrip(".").lower()
+        if fmt == "zip":
+            file_path = f"/vsizip/{file_path}"
+        yield file_path, fmt
+
+
+def has_arrow_io():
+    """
+    Whether the vectorized pyogrio/Arrow read path is installed
+    """
+    return find_spec("pyogrio") is not None and find_spec("pyarrow") is not None
+
+
+def list_columns(file_path):
+    """
+    List the attribute columns of a vector file without reading its features
+    """
+    if find_spec("pyogrio") is not None:
+        import pyogrio
+
+        return list(pyogrio.read_info(file_path)["fields"])
+
+    import fiona
 
-    return file_path
+    with fiona.open(file_path) as src:
+        return list(src.schema["properties"])
+
+
+def read_vector(file_path, fmt=None, columns=None, bbox=None):
+    """
+    Read a vector file into a GeoDataFrame, through pyogrio with Arrow when it is
+    installed and fiona otherwise. `columns` limits the attributes that are read
+    and `bbox` (minx, miny, maxx, maxy) the features.
+    """
+    if find_spec("pyogrio") is not None:
+        return gpd.read_file(
+            file_path,
+            engine="pyogrio",
+            use_arrow=has_arrow_io(),
+            columns=columns,
+            bbox=bbox,
+        )
+
+    kwargs = {"engine": "fiona", "bbox": bbox}
+    if fmt == "kml" or file_path.lower().endswith(".kml"):
+        gpd.io.file.fiona.drvsupport.supported_drivers["KML"] = "rw"
+        kwargs["driver"] = "KML"
+    gdf = gpd.read_file(file_path, **kwargs)
+    if columns is not None:
+        gdf = gdf[list(columns) + [gdf.geometry.name]]
+    return gdf
+
+
+def available_engines():
+    """
+    Names of the ENGINES installed here
+    """
+    names = []
+    if find_spec("pyogrio") is not None:
+        if has_arrow_io():
+            names.append("pyogrio-arrow")
+        names.append("pyogrio")
+    if find_spec("fiona") is not None:
+        names.append("fiona")
+    return names
+
+
+def _write_sample(path, count, seed=0):
+    rng = np.random.default_rng(seed)
+    gdf = gpd.GeoDataFrame(
+        {
+            "id": np.arange(count),
+            "name": [f"feature {i}" for i in range(count)],
+            "value": rng.random(count),
+        },
+        geometry=gpd.points_from_xy(
+            rng.uniform(-125, -66, count), rng.uniform(24, 50, count)
+        ),
+        crs="EPSG:4326",
+    )
+    gdf.to_file(path, driver="GeoJSON")
+
+
+def benchmark(counts=(10000, 100000, 1000000), engines=None):
+    """
+    Time and peak memory of reading a synthetic GeoJSON of each feature count
+    through each read engine
+    """
+    engines = engines or available_engines()
+    result = {"python": sys.version.split()[0], "engines": engines, "runs": []}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for count in counts:
+            path = os.path.join(tmp_dir, f"{count}.geojson")
+            _write_sample(path, count)
+            for engine in engines:
+                script = _READ_SCRIPT.format(path=path, kwargs=ENGINES[engine])
+                process = subprocess.run(
+                    [sys.executable, "-c", script],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+                run = json.loads(process.stdout.strip().splitlines()[-1])
+                run.update(
+                    count=count,
+                    engine=engine,
+                    megabytes=os.path.getsize(path) / 2**20,
+                )
+                print(
+                    f"{count:>9,} features, {engine}: {run['seconds']:.2f} s, "
+                    f"peak {run['peak_mb']:,.0f} MB ({run['baseline_mb']:,.0f} MB after imports)",
+                    file=sys.stderr,
+                )
+                result["runs"].append(run)
+    return result
 
 
 def app():
@@ -54,19 +253,53 @@ def app():
         container = st.container()
 
         if data or url:
-            if data:
-                file_path = save_uploaded_file(data, data.name)
-                layer_name = os.path.splitext(data.name)[0]
-            elif url:
-                file_path = url
-                layer_name = url.split("/")[-1].split(".")[0]
-
             with row1_col1:
-                if file_path.lower().endswith(".kml"):
-                    gpd.io.file.fiona.drvsupport.supported_drivers["KML"] = "rw"
-                    gdf = gpd.read_file(file_path, driver="KML")
+                if data:
+                    layer_name = os.path.splitext(data.name)[0]
+                    try:
+                        with ingest_upload(data, data.name) as (file_path, fmt):
+                            fields = list_columns(file_path)
+                            columns = container.multiselect(
+                                "Select attributes to load", fields, fields
+                            )
+                            gdf = read_vector(file_path, fmt, columns=columns)
+                    except ValueError as e:
+                        st.error(str(e))
+                        st.stop()
+                elif url:
+                    layer_name = url.split("/")[-1].split(".")[0]
+                    gdf = read_vector(url)
+
+                source = upload_digest(data) if data else url
+                lod_key = (source, tuple(gdf.columns))
+                lods = lod_cache.get(lod_key)
+                if lods is None:
+                    lods = build_lods(gdf)
+                    lod_cache.set(lod_key, lods)
+
+                zoom = container.slider("Map zoom level", 1, 22, 4)
+                use_tiles = (
+                    backend != "kepler.gl"
+                    and vector_tiles.available()
+                    and container.checkbox("Serve as vector tiles", False)
+                )
+                layer_id = hashlib.sha1(repr(lod_key).encode()).hexdigest()[:16]
+                if use_tiles:
+                    tile_layer = layer_id
                 else:
-                    gdf = gpd.read_file(file_path)
+                    # The pydeck view is fixed at lat 40, lon -100, so only the
+                    # features in that viewport are sent.
+                    bbox = index = None
+                    if backend == "pydeck":
+                        bbox = viewport_bbox(-100, 40, zoom, width, height)
+                        index = get_index(layer_id, lods[min(lods)])
+                    total = len(gdf)
+                    gdf, level, size = select_lod(lods, zoom, bbox, index=index)
+                    container.caption(
+                        f"Level of detail: zoom {level}, {len(gdf):,} of {total:,} "
+                        f"features, {size:,} bytes"
+                    )
+
                 lon, lat = leafmap.gdf_centroid(gdf)
                 if backend == "pydeck":
 
@@ -79,14 +312,20 @@ def app():
                                 "Select a column to apply random colors", column_names
                             )
 
-                    m = leafmap.Map(center=(40, -100))
+                    m = leafmap.Map(center=(40, -100), zoom=zoom)
                     # m = leafmap.Map(center=(lat, lon))
-                    m.add_gdf(gdf, random_color_column=random_column)
+                    if use_tiles:
+                        m.layers.append(vector_tiles.pydeck_layer(tile_layer, gdf))
+                    else:
+                        m.add_gdf(gdf, random_color_column=random_column)
                     st.pydeck_chart(m)
 
                 else:
                     m = leafmap.Map(center=(lat, lon), draw_export=True)
-                    m.add_gdf(gdf, layer_name=layer_name)
+                    if use_tiles:
+                        vector_tiles.folium_layer(tile_layer, gdf).add_to(m)
+                    else:
+                        m.add_gdf(gdf, layer_name=layer_name)
                     if backend == "folium":
                         m.zoom_to_gdf(gdf)
                     m.to_streamlit(width=width, height=height)
@@ -95,3 +334,17 @@ def app():
             with row1_col1:
                 m = leafmap.Map()
                 st.pydeck_chart(m)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--benchmark", type=int, nargs="+", metavar="COUNT", required=True
+    )
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES))
+    args = parser.parse_args(argv)
+    print(json.dumps(benchmark(args.benchmark, args.engines), indent=4))
+
+
+if __name__ == "__main__":
+    main()
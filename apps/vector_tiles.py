@@ -0,0 +1,161 @@
+import mapbox_vector_tile
+import shapely
+from branca.element import MacroElement
+from jinja2 import Template
+from . import tile_server
+from .spatial_index import build_index
+from .cache import TTLCache
+
+EXTENT = 4096
+BUFFER = 64
+WORLD = 20037508.342789244
+
+# Reprojected layers and their spatial index, most recently used first out. An
+# evicted layer is registered again when a page next adds it.
+_layers = TTLCache(maxsize=32, ttl=None, maxbytes=1024 * 1024 * 1024)
+tile_cache = TTLCache(maxsize=4096, ttl=None)
+
+
+def tile_bounds(z, x, y):
+    """
+    Web Mercator bounds (minx, miny, maxx, maxy) of an XYZ tile
+    """
+    size = 2 * WORLD / 2**z
+    minx = -WORLD + x * size
+    maxy = WORLD - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def available():
+    """
+    Whether layers registered in this process can be served: local tiles are
+    enabled with a URL the browser can use, the process runs the tile server
+    and the server is reachable at that URL
+    """
+    return (
+        tile_server.configured() and tile_server.serving() and tile_server.reachable()
+    )
+
+
+def register_layer(name, gdf, source=None):
+    """
+    Serve a GeoDataFrame as Mapbox Vector Tiles and return the tile URL template.
+    Names must identify the data; registering a name twice keeps the first layer.
+    The spatial index is persisted when the layer's source file is given.
+    """
+    if name not in _layers:
+        if gdf.crs is None:
+            gdf = gdf.set_crs(epsg=4326)
+        gdf = gdf.to_crs(epsg=3857)
+        # Build the index now rather than on the first tile. It is kept with
+        # the layer, so it goes when the layer is evicted.
+        index = build_index(f"{name}_3857", gdf, source=source)
+        nbytes = int(gdf.memory_usage(deep=True).sum())
+        nbytes += 16 * int(shapely.get_num_coordinates(gdf.geometry.to_numpy()).sum())
+        _layers.set(name, (gdf, index), nbytes=nbytes)
+    return f"{tile_server.base_url()}/mvt/{name}/{{z}}/{{x}}/{{y}}.pbf"
+
+
+def render_tile(name, z, x, y):
+    """
+    Slice one layer into a vector tile
+    """
+    gdf, index = _layers.get(name, count=False)
+    minx, miny, maxx, maxy = tile_bounds(z, x, y)
+    pad = (maxx - minx) * BUFFER / EXTENT
+    bbox = (minx - pad, miny - pad, maxx + pad, maxy + pad)
+
+    subset = gdf.iloc[index.query(bbox)]
+    geoms = shapely.clip_by_rect(subset.geometry.to_numpy(), *bbox)
+    # One tile unit; finer detail is invisible at this zoom.
+    geoms = shapely.simplify(geoms, (maxx - minx) / EXTENT)
+
+    properties = subset.drop(columns=subset.geometry.name).to_dict("records")
+    features = [
+        {"geometry": geom, "properties": _properties(props)}
+        for geom, props in zip(geoms, properties)
+        if not geom.is_empty
+    ]
+    return mapbox_vector_tile.encode(
+        [{"name": name, "features": features}],
+        default_options={
+            "quantize_bounds": (minx, miny, maxx, maxy),
+            "extents": EXTENT,
+        },
+    )
+
+
+def _properties(props):
+    """
+    Convert attribute values to the types a vector tile can hold
+    """
+    result = {}
+    for key, value in props.items():
+        if hasattr(value, "item"):
+            value = value.item()
+        if value is None or value != value:
+            continue
+        if not isinstance(value, (str, int, float, bool)):
+            value = str(value)
+        result[key] = value
+    return result
+
+
+def get_tile(name, z, x, y):
+    key = (name, z, x, y)
+    tile = tile_cache.get(key)
+    if tile is None:
+        tile = render_tile(name, z, x, y)
+        tile_cache.set(key, tile, nbytes=len(tile))
+    return tile
+
+
+def _handle(parts):
+    name, z, x, y = parts[0], int(parts[1]), int(parts[2]), int(parts[3].split(".")[0])
+    if name not in _layers:
+        return 404, "text/plain", b"Unknown layer"
+    if not (0 <= x < 2**z and 0 <= y < 2**z):
+        return 400, "text/plain", b"Tile out of range"
+    return 200, "application/x-protobuf", get_tile(name, z, x, y)
+
+
+tile_server.register_route("mvt", _handle)
+
+
+def folium_layer(name, gdf, color="#3388ff", title=None, hover=False, source=None):
+    """
+    A folium vector-grid layer served from the local tile server. With hover,
+    the attributes of the feature under the cursor are shown in a popup.
+    """
+    import folium.plugins as plugins
+
+    url = register_layer(name, gdf, source)
+    style = {"fill": True, "weight": 1, "color": color, "fillOpacity": 0.4}
+    options = {"vectorTileLayerStyles": {name: style}}
+    if hover:
+        options["interactive"] = True
+    layer = plugins.VectorGridProtobuf(url, title or name, options)
+    if hover:
+        _HoverPopup().add_to(layer)
+    return layer
+
+
+class _HoverPopup(MacroElement):
+    """
+    Show the attributes of the hovered feature of the parent vector grid
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        {{ this._parent.get_name() }}.on("mouseover", function(e) {
+            var props = e.layer.properties, rows = [];
+            for (var key in props) {
+                rows.push("<b>" + key + "</b>: " + props[key]);
+            }
+            L.popup({closeButton: false, autoPan: false})
+                .setLatLng(e.latlng)
+                .setContent(rows.join("<br>"))
+                .openOn(e.target._map);
+        });
+        {% endmacro %}
+    """)
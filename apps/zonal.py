@@ -0,0 +1,211 @@
+"""
+Water area and fraction per NHD watershed (HUC2-HUC10) for every catalog
+dataset with a local water mask, written to a Parquet table the app reads on
+hover. Reruns only recompute HUCs whose geometry or mask changed.
+
+    python -m apps.zonal --levels NHD-HUC8 NHD-HUC10 --workers 8
+"""
+
+import argparse
+import hashlib
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import rasterio
+import shapely
+from rasterio.errors import WindowError
+from rasterio.features import geometry_mask
+from rasterio.windows import Window, from_bounds
+from .agreement import mask_path, row_areas, windows
+from .catalog import DATA_DIR, get_entry, layer_names, local_path, read_local
+
+STATS_PATH = os.path.join(DATA_DIR, "huc_stats.parquet")
+BATCH = 64
+COLUMNS = [
+    "huc",
+    "dataset",
+    "water_km2",
+    "area_km2",
+    "water_fraction",
+    "mask_version",
+    "geometry_hash",
+]
+
+
+def huc_column(gdf):
+    """
+    The HUC id column of a WBD layer, e.g. huc8
+    """
+    for column in gdf.columns:
+        if re.fullmatch(r"huc\d+", column.lower()):
+            return column
+    raise KeyError("no HUC id column")
+
+
+def mask_version(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def zonal_water(src, geometry):
+    """
+    Water and valid area in km² of one polygon over an open water mask,
+    read window by window
+    """
+    window = from_bounds(*geometry.bounds, src.transform)
+    window = window.round_offsets().round_lengths()
+    window = window.intersection(Window(0, 0, src.width, src.height))
+    col, row = int(window.col_off), int(window.row_off)
+    bounds = (col, row, col + int(window.width), row + int(window.height))
+
+    water = area = 0.0
+    for chunk in windows(src.width, src.height, bounds=bounds):
+        data = src.read(1, window=chunk)
+        inside = geometry_mask(
+            [geometry],
+            out_shape=data.shape,
+            transform=src.window_transform(chunk),
+            invert=True,
+        )
+        weights = np.broadcast_to(
+            row_areas(src.transform, src.crs, chunk.row_off, data.shape[0]),
+            data.shape,
+        )
+        valid = inside & (data <= 1)
+        water += weights[valid & (data == 1)].sum()
+        area += weights[valid].sum()
+    return float(water), float(area)
+
+
+def _batch_job(job):
+    path, hucs, geometries = job
+    results = []
+    with rasterio.open(path) as src:
+        for huc, wkb in zip(hucs, geometries):
+            try:
+                water, area = zonal_water(src, shapely.from_wkb(wkb))
+            except WindowError:
+                water = area = 0.0
+            results.append((huc, water, area))
+    return results
+
+
+def read_stats(path=STATS_PATH):
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.read_parquet(path)
+
+
+def compute(levels=None, datasets=None, out=STATS_PATH, workers=None, batch=BATCH):
+    """
+    Update the per-HUC statistics table, skipping (HUC, dataset) rows whose
+    geometry and water mask are unchanged since the last run. Rows of levels and
+    datasets outside this run are kept as they are; rows in it are dropped if
+    their HUC or mask no longer exists.
+    """
+    levels = levels or layer_names("watersheds")
+    datasets = datasets or layer_names("surface_water")
+    masks = {name: mask_path(name) for name in datasets}
+    masks = {name: path for name, path in masks.items() if path is not None}
+
+    old = read_stats(out)
+    done = set(
+        zip(old["huc"], old["dataset"], old["mask_version"], old["geometry_hash"])
+    )
+    keep = []
+    jobs = []
+    hashes = {}
+    # (HUC digits, dataset) pairs this run is authoritative for.
+    scopes = set()
+    for level in levels:
+        path = local_path(get_entry(level, "watersheds")["layers"][0])
+        if path is None:
+            print(f"{level}: no local boundaries, skipped")
+            continue
+        hucs = read_local(path)
+        column = huc_column(hucs)
+        digits = int(column[3:])
+        scopes.update((digits, name) for name in datasets)
+        for name, mask in masks.items():
+            version = mask_version(mask)
+            with rasterio.open(mask) as src:
+                projected = hucs.to_crs(src.crs) if hucs.crs else hucs
+            todo = []
+            for huc, geom, projected_geom in zip(
+                hucs[column], hucs.geometry, projected.geometry
+            ):
+                geometry_hash = hashlib.sha1(shapely.to_wkb(geom)).hexdigest()
+                if (huc, name, version, geometry_hash) in done:
+                    keep.append((huc, name, version, geometry_hash))
+                    continue
+                hashes[(huc, name)] = (version, geometry_hash)
+                todo.append((huc, shapely.to_wkb(projected_geom)))
+            print(f"{level} / {name}: {len(todo)} HUCs to compute")
+            for i in range(0, len(todo), batch):
+                hucs_batch, wkbs = zip(*todo[i : i + batch])
+                jobs.append((name, (mask, hucs_batch, wkbs)))
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_batch_job, [job for _, job in jobs])
+        for (name, _), batch_results in zip(jobs, results):
+            for huc, water, area in batch_results:
+                version, geometry_hash = hashes[(huc, name)]
+                fraction = water / area if area else 0.0
+                rows.append((huc, name, water, area, fraction, version, geometry_hash))
+
+    index = old.set_index(["huc", "dataset", "mask_version", "geometry_hash"]).index
+    in_scope = [
+        (len(str(huc)), name) in scopes for huc, name in zip(old["huc"], old["dataset"])
+    ]
+    kept = old.loc[~np.array(in_scope, dtype=bool) | index.isin(keep)]
+    table = pd.concat([kept[COLUMNS], pd.DataFrame(rows, columns=COLUMNS)])
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    table.to_parquet(out, index=False)
+    return table
+
+
+@lru_cache(maxsize=4)
+def _wide_stats(path, mtime):
+    table = read_stats(path)
+    wide = table.pivot_table(
+        index="huc", columns="dataset", values="water_fraction", aggfunc="first"
+    )
+    wide.columns = [f"{name} water %" for name in wide.columns]
+    return (wide * 100).round(2)
+
+
+def join_stats(gdf, path=STATS_PATH):
+    """
+    Add the precomputed water percentage per dataset to a HUC GeoDataFrame.
+    Returns the joined frame and a version string of the statistics, or
+    (None, None) if there are none for it.
+    """
+    if not os.path.exists(path):
+        return None, None
+    mtime = os.path.getmtime(path)
+    wide = _wide_stats(path, mtime)
+    column = huc_column(gdf)
+    if not gdf[column].isin(wide.index).any():
+        return None, None
+    return gdf.join(wide, on=column), str(int(mtime))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--levels", nargs="*", help="watershed layers, default all")
+    parser.add_argument("--datasets", nargs="*", help="catalog layers, default all")
+    parser.add_argument("--out", default=STATS_PATH)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args(argv)
+
+    table = compute(args.levels, args.datasets, args.out, args.workers)
+    print(f"{len(table)} rows written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
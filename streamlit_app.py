@@ -1,18 +1,22 @@
+import importlib
+
 import streamlit as st
 from streamlit_option_menu import option_menu
-from apps import home, datasets, split  # import your app modules here
+from apps import tracing
 
 st.set_page_config(
     page_title="Global Surface Water Information System (GSWIS)", layout="wide"
 )
 
-# A dictionary of apps in the format of {"App title": "App icon"}
+# A list of apps in the format of {"module": "apps module", "title": "App title",
+# "icon": "App icon"}. A page module is imported only when it is selected, so
+# Home does not load Earth Engine, geemap or geopandas.
 # More icons can be found here: https://icons.getbootstrap.com
 
 apps = [
-    {"func": home.app, "title": "Home", "icon": "house"},
-    {"func": datasets.app, "title": "Datasets", "icon": "map"},
-    {"func": split.app, "title": "Split-panel Map", "icon": "layout-split"},
+    {"module": "home", "title": "Home", "icon": "house"},
+    {"module": "datasets", "title": "Datasets", "icon": "map"},
+    {"module": "split", "title": "Split-panel Map", "icon": "layout-split"},
 ]
 
 titles = [app["title"] for app in apps]
@@ -48,5 +52,8 @@ with st.sidebar:
 
 for app in apps:
     if app["title"] == selected:
-        app["func"]()
+        with tracing.rerun(selected, st.session_state):
+            importlib.import_module(f"apps.{app['module']}").app()
         break
+
+tracing.debug_panel(st.session_state)
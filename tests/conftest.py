@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+from apps.loadtest import StubEE
+
+# The pages only use geemap.foliumap; select its backend so importing geemap
+# does not load the ipyleaflet one first.
+os.environ.setdefault("USE_FOLIUM", "1")
+
+# Earth Engine expressions are built against the local stub used by the load
+# test, so the tests run without credentials or network access.
+_stub = StubEE(latency=0, jitter=0)
+_module = _stub.module()
+_module._stub = _stub
+sys.modules["ee"] = _module
+
+
+@pytest.fixture
+def ee_stub(monkeypatch):
+    """
+    The Earth Engine stub with its call counts reset and no latency
+    """
+    _stub.calls.clear()
+    monkeypatch.setattr(_stub, "latency", 0)
+    monkeypatch.setattr(_stub, "jitter", 0)
+    return _stub
@@ -0,0 +1,48 @@
+import subprocess
+import sys
+
+import pytest
+import shapely.geometry
+
+from apps import agreement
+
+# The synthetic masks cover -100..-90, 30..40.
+INSIDE = shapely.geometry.mapping(shapely.geometry.box(-98, 32, -95, 35))
+OUTSIDE = shapely.geometry.mapping(shapely.geometry.box(10, 45, 12, 47))
+
+
+@pytest.fixture(scope="module")
+def masks(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp("masks")
+    left, right = str(tmp_path / "left.tif"), str(tmp_path / "right.tif")
+    agreement._write_synthetic(left, 512, 1, chunk=256)
+    agreement._write_synthetic(right, 512, 2, chunk=256)
+    return left, right
+
+
+def test_agreement_within_roi(masks):
+    full = agreement.agreement(*masks, workers=1, chunk=256)
+    roi = agreement.agreement(*masks, geometries=[INSIDE], workers=1, chunk=256)
+
+    assert (
+        0
+        < sum(map(sum, roi["confusion_pixels"]))
+        < sum(map(sum, full["confusion_pixels"]))
+    )
+    assert 0 <= roi["iou"] <= 1
+
+
+def test_roi_outside_the_masks_is_a_value_error(masks):
+    with pytest.raises(ValueError, match="does not overlap"):
+        agreement.agreement(*masks, geometries=[OUTSIDE], workers=1, chunk=256)
+
+
+def test_import_does_not_load_earth_engine():
+    code = (
+        "import sys, apps.agreement; "
+        "print(sorted(m for m in ('ee', 'geemap') if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "[]"
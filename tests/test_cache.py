@@ -0,0 +1,71 @@
+import pickle
+import sys
+
+import geopandas as gpd
+import pandas as pd
+import shapely
+
+from apps.cache import RedisCache, SHARED_TTL, SQLiteCache, dumps, loads
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.expiry[key] = ex
+
+
+class Payload:
+    def __reduce__(self):
+        return (print, ("unpickled",))
+
+
+def roi_value():
+    ee = sys.modules["ee"]
+    gdf = gpd.GeoDataFrame(geometry=[shapely.box(0, 0, 1, 1)], crs="EPSG:4326")
+    fc = ee.FeatureCollection("users/test/roi")
+    return gdf, fc, {"vertices_before": 5, "tolerance": 0.5}
+
+
+def test_cached_values_round_trip_through_json(ee_stub):
+    gdf, fc, stats = loads(dumps(roi_value()))
+    assert gdf.crs.to_epsg() == 4326
+    assert gdf.geometry.iloc[0].equals(shapely.box(0, 0, 1, 1))
+    assert isinstance(fc, sys.modules["ee"].FeatureCollection)
+    assert stats == {"vertices_before": 5, "tolerance": 0.5}
+
+    df = pd.DataFrame({"Dataset": ["JRC"], "Water area (km²)": [1.5]})
+    pd.testing.assert_frame_equal(loads(dumps(df)), df)
+    assert loads(dumps("https://tiles/{z}/{x}/{y}")) == "https://tiles/{z}/{x}/{y}"
+
+
+def test_sqlite_cache_is_shared_and_ignores_pickles(tmp_path, ee_stub):
+    path = str(tmp_path / "cache.db")
+    writer = SQLiteCache(path, "roi")
+    reader = SQLiteCache(path, "roi")
+    writer.set("upload", roi_value())
+    assert reader.get("upload")[2]["tolerance"] == 0.5
+
+    writer._conn.execute(
+        "UPDATE entries SET value=? WHERE namespace=?",
+        (pickle.dumps(Payload()), writer.namespace),
+    )
+    writer._conn.commit()
+    assert reader.get("upload") is None
+
+
+def test_redis_entries_always_expire():
+    client = FakeRedis()
+    cache = RedisCache(None, "roi", ttl=None, client=client)
+    cache.set("upload", "value")
+    assert list(client.expiry.values()) == [SHARED_TTL]
+    assert cache.get("upload") == "value"
+
+    client.data = {key: pickle.dumps(Payload()) for key in client.data}
+    assert cache.get("upload", "missing") == "missing"
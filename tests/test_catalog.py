@@ -0,0 +1,81 @@
+import time
+
+import folium
+import pytest
+
+pytest.importorskip("streamlit")
+
+from apps import cache, catalog  # noqa: E402
+
+LATENCY = 0.2
+
+
+@pytest.fixture
+def ee_layers(ee_stub, monkeypatch):
+    """
+    Resolve every catalog layer through the delayed Earth Engine stub
+    """
+    monkeypatch.setattr(ee_stub, "latency", LATENCY)
+    monkeypatch.setattr(catalog, "local_path", lambda spec: None)
+    cache.tile_url_cache.clear()
+    yield ee_stub
+    cache.tile_url_cache.clear()
+
+
+def layer_count(names):
+    return sum(len(catalog.get_entry(name)["layers"]) for name in names)
+
+
+def test_layers_resolve_concurrently(ee_layers):
+    names = catalog.layer_names()[:6]
+    m = folium.Map()
+
+    start = time.perf_counter()
+    errors = catalog.add_catalog_layers(m, names)
+    seconds = time.perf_counter() - start
+
+    slowest = max(len(catalog.get_entry(name)["layers"]) for name in names) * LATENCY
+    total = layer_count(names) * LATENCY
+    print(f"wall {seconds:.2f} s, slowest layer {slowest:.2f} s, serial {total:.2f} s")
+    assert errors == {}
+    assert ee_layers.snapshot()["getMapId"] == layer_count(names)
+    assert seconds < slowest + LATENCY
+    assert seconds < total / 2
+
+
+def test_layer_order_is_deterministic(ee_layers, monkeypatch):
+    monkeypatch.setattr(ee_layers, "latency", 0)
+    names = catalog.layer_names()[:6]
+    m = folium.Map()
+    catalog.add_catalog_layers(m, names)
+
+    added = [
+        layer.layer_name
+        for layer in m._children.values()
+        if isinstance(layer, folium.raster_layers.TileLayer) and layer.overlay
+    ]
+    expected = [
+        spec.get("name", name)
+        for name in names
+        for spec in catalog.get_entry(name)["layers"]
+    ]
+    assert added == expected
+
+
+def test_failed_layer_reports_its_own_error(ee_layers, monkeypatch):
+    monkeypatch.setattr(ee_layers, "latency", 0)
+    names = catalog.layer_names()[:3]
+    build = catalog.build_ee_object
+    failing = catalog.get_entry(names[1])["layers"][0]["asset"]
+
+    def build_or_fail(spec, roi=None):
+        if spec["asset"] == failing:
+            raise RuntimeError("quota exceeded")
+        return build(spec, roi)
+
+    monkeypatch.setattr(catalog, "build_ee_object", build_or_fail)
+    m = folium.Map()
+    errors = catalog.add_catalog_layers(m, names)
+
+    assert list(errors) == [names[1]]
+    assert "quota exceeded" in str(errors[names[1]])
@@ -0,0 +1,25 @@
+import rasterio
+
+from apps import cog
+
+
+def test_convert_writes_a_tiled_cog_with_overviews(tmp_path):
+    plain = str(tmp_path / "plain.tif")
+    cog._write_plain(plain, 2048)
+    record = cog.convert(plain, str(tmp_path / "cog.tif"))
+
+    assert record["overviews"]
+    with rasterio.open(tmp_path / "cog.tif") as src:
+        assert src.block_shapes == [(512, 512)]
+        assert src.nodata == cog.MASK_NODATA
+
+
+def test_benchmark_reports_tile_latency_per_level():
+    result = cog.benchmark(size=1024, levels=3, tiles=5)
+
+    assert set(result) >= {"plain", "cog", "overviews", "convert_seconds"}
+    for name in ("plain", "cog"):
+        assert sorted(result[name]) == [0, 1, 2]
+        assert all(
+            0 < level["p50_ms"] <= level["p95_ms"] for level in result[name].values()
+        )
@@ -0,0 +1,93 @@
+import importlib
+import sys
+
+import pytest
+
+geemap = pytest.importorskip("geemap.foliumap")
+
+
+@pytest.fixture
+def initialize_calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(geemap, "ee_initialize", lambda *args: calls.append(args))
+    return calls
+
+
+def fresh_import(monkeypatch, *names):
+    for name in list(sys.modules):
+        if name.startswith("apps.") and name != "apps.loadtest":
+            monkeypatch.delitem(sys.modules, name)
+    return [importlib.import_module(name) for name in names]
+
+
+def test_import_makes_no_ee_calls(ee_stub, initialize_calls, monkeypatch):
+    (data_dict,) = fresh_import(monkeypatch, "apps.data_dict")
+    assert initialize_calls == []
+    assert ee_stub.snapshot() == {}
+    assert data_dict.get_image.cache_info().currsize == 0
+
+
+def test_page_import_makes_no_ee_calls(ee_stub, initialize_calls, monkeypatch):
+    pytest.importorskip("streamlit")
+    fresh_import(monkeypatch, "apps.datasets", "apps.split")
+    assert initialize_calls == []
+    assert ee_stub.snapshot() == {}
+
+
+def test_image_built_once_on_first_use(ee_stub, initialize_calls, monkeypatch):
+    (data_dict,) = fresh_import(monkeypatch, "apps.data_dict")
+    image = data_dict.get_image("NASA DEM")
+    assert data_dict.get_image("NASA DEM") is image
+    assert len(initialize_calls) == 1
+    assert ee_stub.snapshot() == {}
+
+
+def test_failed_initialize_is_retried_after_a_backoff(initialize_calls, monkeypatch):
+    (data_dict,) = fresh_import(monkeypatch, "apps.data_dict")
+    failures = [OSError("network is unreachable")]
+
+    def ee_initialize(*args):
+        initialize_calls.append(args)
+        if failures:
+            raise failures.pop()
+
+    monkeypatch.setattr(geemap, "ee_initialize", ee_initialize)
+
+    assert not data_dict.ee_available()
+    assert not data_dict.ee_available()
+    assert len(initialize_calls) == 1
+
+    monkeypatch.setattr(data_dict, "_ee_retry_at", 0)
+    assert data_dict.ee_available()
+    assert len(initialize_calls) == 2
+
+
+def test_local_cog_backend_without_earth_engine(tmp_path, monkeypatch):
+    (data_dict,) = fresh_import(monkeypatch, "apps.data_dict")
+
+    def ee_initialize(*args):
+        raise OSError("no credentials")
+
+    monkeypatch.setattr(geemap, "ee_initialize", ee_initialize)
+    monkeypatch.setattr(data_dict, "COG_DIR", str(tmp_path))
+    assert data_dict.backends("NASA DEM") == []
+
+    (tmp_path / data_dict.get_dataset("NASA DEM")["cog"]).write_bytes(b"")
+    assert data_dict.backends("NASA DEM") == [data_dict.LOCAL_COG]
+
+
+def test_derived_image_does_not_grow_across_reruns(
+    ee_stub, initialize_calls, monkeypatch
+):
+    (data_dict,) = fresh_import(monkeypatch, "apps.data_dict")
+    ee = sys.modules["ee"]
+
+    sizes = []
+    for _ in range(5):
+        # Each rerun rebuilds the ROI expression from the widget values.
+        roi = ee.FeatureCollection("countries").filter(ee.Filter.eq("name", "Kenya"))
+        image = data_dict.derived_image("NASA DEM", roi)
+        sizes.append(len(image.serialize()))
+    assert len(set(sizes)) == 1
+    assert data_dict.derived_image("NASA DEM", roi) is image
+    assert len(image.serialize()) > len(data_dict.get_image("NASA DEM").serialize())
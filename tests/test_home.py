@@ -0,0 +1,34 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from apps.importtime import HEAVY, ROOT
+
+pytest.importorskip("streamlit.testing.v1")
+
+# Rendered in a fresh interpreter, so modules imported by other tests do not count.
+SCRIPT = """
+import json, sys
+from streamlit.testing.v1 import AppTest
+
+at = AppTest.from_string("from apps import home; home.app()").run()
+print(json.dumps({
+    "exception": [e.message for e in at.exception],
+    "heavy": [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def test_home_renders_without_heavy_imports():
+    process = subprocess.run(
+        [sys.executable, "-c", SCRIPT % (HEAVY,)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    assert result["exception"] == []
+    assert result["heavy"] == []
@@ -0,0 +1,46 @@
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from apps.lod import MAX_PAYLOAD_BYTES, build_lods, select_lod, viewport_bbox
+
+
+def rings(count, vertices, seed=0):
+    """
+    `count` jagged polygons of `vertices` vertices each, spread over the US
+    """
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    geoms = []
+    for lon, lat in zip(rng.uniform(-120, -70, count), rng.uniform(25, 48, count)):
+        radius = 0.5 * (1 + 0.05 * rng.standard_normal(vertices))
+        geoms.append(
+            shapely.Polygon(
+                np.column_stack(
+                    [lon + radius * np.cos(angles), lat + radius * np.sin(angles)]
+                )
+            )
+        )
+    return gpd.GeoDataFrame({"id": np.arange(count)}, geometry=geoms, crs="EPSG:4326")
+
+
+def test_million_vertex_layer_fits_the_payload_budget():
+    gdf = rings(100, 10000)
+    assert shapely.get_num_coordinates(gdf.geometry.to_numpy()).sum() >= 1_000_000
+
+    lods = build_lods(gdf)
+    for zoom in (4, 18):
+        selected, level, size = select_lod(lods, zoom)
+        print(f"zoom {zoom}: level {level}, {len(selected)} features, {size:,} bytes")
+        assert size <= MAX_PAYLOAD_BYTES
+        assert len(selected) > 0
+
+
+def test_viewport_selection_keeps_the_visible_features():
+    gdf = rings(100, 200)
+    lods = build_lods(gdf)
+    bbox = viewport_bbox(-100, 40, 6)
+    selected, _, _ = select_lod(lods, 6, bbox)
+
+    visible = gdf.cx[bbox[0] : bbox[2], bbox[1] : bbox[3]]
+    assert sorted(selected["id"]) == sorted(visible["id"])
@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("folium")
+AppTest = pytest.importorskip("streamlit.testing.v1").AppTest
+
+
+def page():
+    import streamlit as st
+    from apps.map_state import MapState
+
+    views = {"Kenya": (0.5, 38.0, 6), "Peru": (-9.0, -75.0, 5)}
+    state = MapState("test")
+    latitude, longitude, zoom = state.view_inputs()
+    if st.checkbox("Select a country"):
+        country = st.selectbox("Country", list(views))
+        state.select(country, lambda: views[country])
+    else:
+        state.select(None)
+    st.write(latitude, longitude, zoom)
+
+
+def view(at):
+    return at.number_input[0].value, at.number_input[1].value, at.slider[0].value
+
+
+def test_view_inputs_recenter_only_when_the_country_changes():
+    at = AppTest.from_function(page).run()
+    assert view(at) == (40.0, -100.0, 4)
+
+    at.checkbox[0].check().run()
+    assert view(at) == (0.5, 38.0, 6)
+
+    # The inputs keep working while the same country stays selected.
+    at.slider[0].set_value(9).run()
+    at.number_input[0].set_value(1.5).run()
+    assert view(at) == (1.5, 38.0, 9)
+
+    at.selectbox[0].set_value("Peru").run()
+    assert view(at) == (-9.0, -75.0, 5)
+    assert not at.exception
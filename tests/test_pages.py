@@ -0,0 +1,16 @@
+import pytest
+
+pytest.importorskip("geemap.foliumap")
+AppTest = pytest.importorskip("streamlit.testing.v1").AppTest
+
+from apps.loadtest import PAGE_SCRIPT, ROOT, SESSIONS  # noqa: E402
+
+
+@pytest.mark.parametrize("page", sorted(SESSIONS))
+def test_page_session_runs_without_errors(page, ee_stub):
+    at = AppTest.from_string(
+        PAGE_SCRIPT.format(root=ROOT, page=page), default_timeout=60
+    )
+    for step in SESSIONS[page](at):
+        at.run()
+        assert not at.exception, f"{page}:{step}: {at.exception[0].message}"
@@ -0,0 +1,55 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+pytest.importorskip("geemap")
+pytest.importorskip("streamlit")
+
+from apps.roi import simplify_roi  # noqa: E402
+
+
+def circle(lon, lat, radius, vertices):
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    return shapely.Polygon(
+        np.column_stack([lon + radius * np.cos(angles), lat + radius * np.sin(angles)])
+    )
+
+
+def roi(*geoms):
+    return gpd.GeoDataFrame(geometry=list(geoms), crs="EPSG:4326")
+
+
+def test_roi_under_budget_is_unchanged():
+    # About 10 km across with 501 vertices.
+    geom = circle(-90, 40, 0.05, 500)
+    gdf, stats = simplify_roi(roi(geom), max_vertices=5000)
+
+    assert stats["vertices_after"] == stats["vertices_before"] == 501
+    assert stats["tolerance"] == 0
+    assert gdf.geometry.iloc[0].equals(geom)
+
+
+def test_roi_over_budget_is_simplified_to_fit():
+    geom = circle(-90, 40, 0.05, 20000)
+    gdf, stats = simplify_roi(roi(geom), max_vertices=1000)
+
+    assert stats["vertices_after"] <= 1000
+    assert gdf.geometry.iloc[0].area == pytest.approx(geom.area, rel=0.01)
+
+
+def test_small_island_is_kept():
+    mainland = circle(-90, 40, 1, 500)
+    # About 200 m across, 0.001% of the mainland's area.
+    island = circle(-88, 40, 0.001, 50)
+    gdf, _ = simplify_roi(roi(mainland, island))
+
+    assert len(shapely.get_parts(gdf.geometry.iloc[0])) == 2
+
+
+def test_sliver_is_dropped():
+    mainland = circle(-90, 40, 1, 500)
+    sliver = shapely.box(-88, 40, -87.99, 40.0000001)
+    gdf, _ = simplify_roi(roi(mainland, sliver))
+
+    assert len(shapely.get_parts(gdf.geometry.iloc[0])) == 1
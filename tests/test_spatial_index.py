@@ -0,0 +1,39 @@
+import geopandas as gpd
+import shapely
+
+from apps import spatial_index, vector_tiles
+from apps.cache import TTLCache
+
+
+def boxes(n):
+    return gpd.GeoDataFrame(
+        {"huc8": [f"{i:08d}" for i in range(n)]},
+        geometry=[shapely.box(i, 0, i + 1, 1) for i in range(n)],
+        crs="EPSG:4326",
+    )
+
+
+def test_index_queries_and_prefixes():
+    index = spatial_index.SpatialIndex.build(boxes(20), "huc8")
+    assert index.query((2.5, 0.5, 4.5, 0.6)).tolist() == [2, 3, 4]
+    assert index.prefix("0000001").tolist() == list(range(10, 20))
+
+
+def test_indexes_are_evicted(monkeypatch):
+    monkeypatch.setattr(spatial_index, "_indexes", TTLCache(maxsize=2, ttl=None))
+    gdf = boxes(5)
+    first = spatial_index.get_index("a", gdf)
+    assert spatial_index.get_index("a", gdf) is first
+    spatial_index.get_index("b", gdf)
+    spatial_index.get_index("c", gdf)
+    assert len(spatial_index._indexes) == 2
+    assert spatial_index.get_index("a", gdf) is not first
+
+
+def test_vector_layers_keep_their_own_index(monkeypatch):
+    monkeypatch.setattr(spatial_index, "_indexes", TTLCache(ttl=None))
+    monkeypatch.setattr(vector_tiles, "_layers", TTLCache(maxsize=1, ttl=None))
+    vector_tiles.register_layer("first", boxes(5))
+    vector_tiles.register_layer("second", boxes(5))
+    assert len(spatial_index._indexes) == 0
+    assert len(vector_tiles._layers) == 1
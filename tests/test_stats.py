@@ -0,0 +1,67 @@
+import pytest
+
+pytest.importorskip("geemap")
+pytest.importorskip("streamlit")
+
+from apps import data_dict, stats  # noqa: E402
+from apps.catalog import COUNTRIES  # noqa: E402
+
+
+@pytest.fixture
+def local_reduce(ee_stub, monkeypatch):
+    """
+    A local stand-in for the Earth Engine reduction that records its calls
+    """
+    monkeypatch.setattr(data_dict, "_ee_initialized", True)
+    stats.stats_cache.clear()
+    calls = []
+
+    def reduce(image, roi, scale):
+        calls.append((image.serialize(), roi.serialize(), scale))
+        return {stats.ROI_AREA: 1000.0, "b0": 100.0, "b1": 250.0}
+
+    reduce.calls = calls
+    yield reduce
+    stats.stats_cache.clear()
+
+
+def roi(name):
+    import ee
+
+    return ee.FeatureCollection(COUNTRIES).filter(ee.Filter.eq("name", name))
+
+
+def test_water_area_reduces_once_for_every_dataset(local_reduce, ee_stub):
+    names = ["OpenStreetMap", "NLCD 2019"]
+    df = stats.water_area(roi("France"), names, scale=120, reduce=local_reduce)
+
+    assert len(local_reduce.calls) == 1
+    assert local_reduce.calls[0][2] == 120
+    assert df["Dataset"].tolist() == names
+    assert df["Water area (km²)"].tolist() == [100.0, 250.0]
+    assert df["% of ROI"].tolist() == [10.0, 25.0]
+    assert ee_stub.snapshot() == {}
+
+
+def test_water_area_is_cached_by_roi(local_reduce):
+    names = ["OpenStreetMap", "NLCD 2019"]
+    first = stats.water_area(roi("France"), names, reduce=local_reduce)
+    again = stats.water_area(roi("France"), names, reduce=local_reduce)
+    assert len(local_reduce.calls) == 1
+    assert again.equals(first)
+
+    stats.water_area(roi("Spain"), names, reduce=local_reduce)
+    assert len(local_reduce.calls) == 2
+
+
+def test_roi_scale_grows_with_the_roi():
+    # About 10 x 10 km, a large country and the whole world.
+    small = stats.bbox_area((-90, 40, -89.88, 40.09))
+    country = stats.bbox_area((-125, 24, -66, 50))
+    world = stats.bbox_area((-180, -90, 180, 90))
+
+    assert world == pytest.approx(5.1e14, rel=0.01)
+    assert stats.roi_scale(small) == 30
+    assert 30 < stats.roi_scale(country) < stats.roi_scale(world)
+    for area in (small, country, world):
+        assert area / stats.roi_scale(area) ** 2 <= stats.MAX_PIXELS
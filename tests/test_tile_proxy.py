@@ -0,0 +1,42 @@
+import pytest
+
+from apps import tile_proxy, tile_server
+
+UPSTREAM = "https://earthengine.test/map/abc/tiles/{z}/{x}/{y}"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = tile_proxy.TileStore(str(tmp_path / "tiles.mbtiles"))
+    monkeypatch.setattr(tile_proxy, "_store", store)
+    return store
+
+
+def test_upstreams_are_shared_through_the_store(store, monkeypatch):
+    url = tile_proxy.proxied_url("layer-key", UPSTREAM)
+    layer = tile_proxy.layer_fingerprint("layer-key")
+    assert url == f"{tile_server.base_url()}/tiles/{layer}/{{z}}/{{x}}/{{y}}"
+
+    # Another worker opens the same file and serves the layer.
+    other = tile_proxy.TileStore(store.path)
+    monkeypatch.setattr(tile_proxy, "_store", other)
+    fetched = []
+    monkeypatch.setattr(
+        tile_proxy, "fetch_url", lambda url: fetched.append(url) or b"png"
+    )
+
+    assert tile_proxy._handle([layer, "3", "1", "2.png"]) == (200, "image/png", b"png")
+    assert tile_proxy._handle([layer, "3", "1", "2.png"]) == (200, "image/png", b"png")
+    assert fetched == ["https://earthengine.test/map/abc/tiles/3/1/2"]
+
+
+def test_unknown_layer_is_not_found(store):
+    status, _, _ = tile_proxy._handle(["unknown", "0", "0", "0.png"])
+    assert status == 404
+
+
+def test_proxy_is_disabled_when_the_server_is_unreachable(store, monkeypatch):
+    monkeypatch.setattr(tile_server, "reachable", lambda: False)
+    assert not tile_proxy.enabled()
+    monkeypatch.setattr(tile_server, "reachable", lambda: True)
+    assert tile_proxy.enabled()
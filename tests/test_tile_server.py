@@ -0,0 +1,70 @@
+import socket
+import urllib.request
+
+import geopandas as gpd
+import pytest
+import shapely
+
+from apps import tile_server, vector_tiles
+from apps.cache import TTLCache
+
+
+@pytest.fixture
+def fresh_checks(monkeypatch):
+    monkeypatch.setattr(tile_server, "_reachable", {})
+
+
+def test_server_answers_health_checks(fresh_checks):
+    host, port = tile_server.start()
+    with urllib.request.urlopen(f"http://{host}:{port}/health", timeout=5) as r:
+        assert r.read() == b"ok"
+    assert tile_server.serving()
+    assert tile_server.reachable()
+
+
+def test_local_tiles_are_opt_in(fresh_checks, monkeypatch):
+    monkeypatch.delenv("GSWIS_TILE_SERVER_URL", raising=False)
+    monkeypatch.delenv("GSWIS_LOCAL_TILES", raising=False)
+    assert tile_server.reachable()
+    assert not vector_tiles.available()
+
+    monkeypatch.setenv("GSWIS_LOCAL_TILES", "1")
+    assert vector_tiles.available()
+
+
+def test_unreachable_url_is_detected(fresh_checks, monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        _, port = s.getsockname()
+    monkeypatch.setenv("GSWIS_TILE_SERVER_URL", f"http://127.0.0.1:{port}")
+    assert not tile_server.reachable(timeout=1)
+    assert not vector_tiles.available()
+
+
+def test_taken_port_falls_back_to_the_configured_address(monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        s.listen()
+        _, port = s.getsockname()
+        monkeypatch.setattr(tile_server, "_server", None)
+        monkeypatch.setattr(tile_server, "_bind_error", None)
+        monkeypatch.setattr(tile_server, "PORT", port)
+
+        assert tile_server.start() == ("127.0.0.1", port)
+        assert not tile_server.serving()
+        assert tile_server.base_url() == f"http://127.0.0.1:{port}"
+
+
+def test_vector_layers_are_bounded(monkeypatch):
+    monkeypatch.setattr(vector_tiles, "_layers", TTLCache(maxsize=2, ttl=None))
+    gdf = gpd.GeoDataFrame(
+        {"id": [1]}, geometry=[shapely.box(-100, 40, -99, 41)], crs="EPSG:4326"
+    )
+    for name in ("a", "b", "c"):
+        vector_tiles.register_layer(f"test_bounded_{name}", gdf)
+
+    assert len(vector_tiles._layers) == 2
+    status, _, _ = vector_tiles._handle(["test_bounded_a", "0", "0", "0.pbf"])
+    assert status == 404
+    status, _, body = vector_tiles._handle(["test_bounded_c", "0", "0", "0.pbf"])
+    assert status == 200 and body
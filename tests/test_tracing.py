@@ -0,0 +1,31 @@
+import socket
+import urllib.request
+
+from apps import tracing
+
+
+def test_metrics_are_served_on_the_configured_port(monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        _, port = s.getsockname()
+    monkeypatch.setattr(tracing, "_metrics_server", None)
+    monkeypatch.setattr(tracing, "METRICS_HOST", "127.0.0.1")
+    monkeypatch.setattr(tracing, "METRICS_PORT", port)
+
+    tracing.record("getMapId", 0.25)
+    assert tracing.start_metrics() == ("127.0.0.1", port)
+    url = f"http://127.0.0.1:{port}/metrics"
+    with urllib.request.urlopen(url, timeout=5) as r:
+        text = r.read().decode()
+    assert 'gswis_span_seconds_count{span="getMapId"}' in text
+    tracing._metrics_server.shutdown()
+    tracing._metrics_server.server_close()
+
+
+def test_taken_metrics_port_is_reported(monkeypatch):
+    monkeypatch.setattr(tracing, "_metrics_server", None)
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        s.listen()
+        _, port = s.getsockname()
+        assert tracing.start_metrics("127.0.0.1", port) is None
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import tracemalloc
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+from apps import upload  # noqa: E402
+
+SIZE = 500 * 1024 * 1024
+FEATURE = (
+    b'{"type": "Feature", "properties": {"id": 1}, "geometry": '
+    b'{"type": "Point", "coordinates": [-90.0, 40.0]}},\n'
+)
+
+
+class LargeUpload:
+    """
+    A file-like GeoJSON upload of `size` bytes whose contents are generated as
+    they are read, so the only large buffers are the ones ingest_upload makes
+    """
+
+    name = "large.geojson"
+
+    def __init__(self, size):
+        self.size = size
+        self.position = 0
+        self.head = b'{"type": "FeatureCollection", "features": [\n'
+
+    def seek(self, position):
+        self.position = position
+
+    def read(self, n):
+        n = min(n, self.size - self.position)
+        if n <= 0:
+            return b""
+        start = self.position
+        self.position += n
+        if start == 0:
+            body = self.head + FEATURE * (n // len(FEATURE) + 1)
+        else:
+            body = FEATURE * (n // len(FEATURE) + 1)
+        return body[:n]
+
+
+@pytest.fixture
+def tmp_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    return tmp_path
+
+
+def test_large_upload_streams_in_constant_memory(tmp_dir):
+    data = LargeUpload(SIZE)
+    tracemalloc.start()
+    try:
+        with upload.ingest_upload(data, data.name) as (path, fmt):
+            _, peak = tracemalloc.get_traced_memory()
+            assert os.path.getsize(path) == SIZE
+            assert fmt == "geojson"
+    finally:
+        tracemalloc.stop()
+
+    print(f"peak {peak / 2**20:.1f} MB for a {SIZE / 2**20:.0f} MB upload")
+    assert peak < 8 * upload.CHUNK_SIZE
+    assert list(tmp_dir.iterdir()) == []
+
+
+def test_upload_over_the_limit_is_rejected(tmp_dir):
+    data = LargeUpload(3 * upload.CHUNK_SIZE)
+    with pytest.raises(ValueError, match="larger than"):
+        with upload.ingest_upload(data, data.name, max_bytes=2 * upload.CHUNK_SIZE):
+            pass
+    assert list(tmp_dir.iterdir()) == []
+
+
+@pytest.mark.parametrize(
+    "head, fmt",
+    [
+        (b"PK\x03\x04rest", "zip"),
+        (b'\xef\xbb\xbf  {"type": "FeatureCollection"', "geojson"),
+        (b'<?xml version="1.0"?><kml xmlns="">', "kml"),
+        (b"name,lat,lon", None),
+    ],
+)
+def test_detect_format(head, fmt):
+    assert upload.detect_format(head) == fmt
+
+
+def test_benchmark_compares_engines():
+    engines = upload.available_engines()
+    result = upload.benchmark([1000, 2000], engines)
+
+    assert [(run["count"], run["engine"]) for run in result["runs"]] == [
+        (count, engine) for count in (1000, 2000) for engine in engines
+    ]
+    assert all(run["features"] == run["count"] for run in result["runs"])
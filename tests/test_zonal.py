@@ -0,0 +1,79 @@
+import geopandas as gpd
+import pytest
+import shapely
+
+pytest.importorskip("streamlit")
+
+from apps import agreement, zonal  # noqa: E402
+
+LEVELS = ["NHD-HUC8", "NHD-HUC10"]
+DATASETS = ["JRC Max Water Extent", "OpenStreetMap"]
+
+
+def boxes(ids, x0):
+    # The synthetic masks cover -100..-90, 30..40.
+    return gpd.GeoDataFrame(
+        {f"huc{len(ids[0])}": ids},
+        geometry=[shapely.box(x0 + i, 32, x0 + i + 1, 33) for i in range(len(ids))],
+        crs="EPSG:4326",
+    )
+
+
+@pytest.fixture
+def watersheds(tmp_path, monkeypatch):
+    masks = {}
+    for seed, name in enumerate(DATASETS):
+        masks[name] = str(tmp_path / f"{seed}.tif")
+        agreement._write_synthetic(masks[name], 256, seed, chunk=256)
+    hucs = {
+        "NHD-HUC8": boxes(["01010001", "01010002"], -99),
+        "NHD-HUC10": boxes(["0101000101", "0101000102"], -95),
+    }
+    monkeypatch.setattr(zonal, "get_entry", lambda level, group: {"layers": [level]})
+    monkeypatch.setattr(zonal, "local_path", lambda spec: spec)
+    monkeypatch.setattr(zonal, "read_local", lambda level: hucs[level])
+    monkeypatch.setattr(zonal, "mask_path", masks.get)
+    return hucs, str(tmp_path / "huc_stats.parquet")
+
+
+def compute(out, levels=LEVELS, datasets=DATASETS):
+    return zonal.compute(levels, datasets, out, workers=1)
+
+
+def test_partial_run_keeps_rows_outside_its_scope(watersheds):
+    _, out = watersheds
+    assert len(compute(out)) == 8
+
+    table = compute(out, levels=["NHD-HUC8"])
+    assert len(table) == 8
+    assert set(zonal.read_stats(out)["huc"]) == {
+        "01010001",
+        "01010002",
+        "0101000101",
+        "0101000102",
+    }
+
+    table = compute(out, datasets=DATASETS[:1])
+    assert len(table) == 8
+
+
+def test_removed_huc_is_dropped(watersheds):
+    hucs, out = watersheds
+    compute(out)
+
+    hucs["NHD-HUC8"] = hucs["NHD-HUC8"].iloc[:1]
+    table = compute(out, levels=["NHD-HUC8"])
+
+    assert "01010002" not in set(table["huc"])
+    assert len(table) == 6
+
+
+def test_unchanged_rows_are_not_recomputed(watersheds, monkeypatch):
+    _, out = watersheds
+    first = compute(out)
+
+    monkeypatch.setattr(zonal, "_batch_job", None)
+    again = compute(out)
+    assert sorted(map(tuple, again.values.tolist())) == sorted(
+        map(tuple, first.values.tolist())
+    )